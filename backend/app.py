@@ -1,23 +1,28 @@
 # app.py
 
-from flask import Flask, jsonify, request
+from flask import Flask, Blueprint, jsonify, request, Response
 from flask_cors import CORS
 import os
 import dotenv
 import json 
 import traceback 
 import threading # NEW: To run database saves in the background
-from supabase import create_client, Client # NEW: Supabase imports
 import requests
-from find_places import find_gluten_free_restaurants_places_api as find_places, categorize_places_with_gemini
-from datetime import datetime, timedelta
-from fuzzywuzzy import fuzz
+from concurrent.futures import ThreadPoolExecutor
+from find_places import find_gluten_free_restaurants_places_api as find_places, categorize_places_with_gemini, classify_places_locally, GOOGLE_TYPES_BY_FILTER
+from resilience import Deadline, UpstreamUnavailable, get_breaker, BREAKERS
+from tiles import load_tile_store
+from cache_store import create_cache_store, CACHE_TTL_DAYS, NEGATIVE_CACHE_TTL_HOURS
+from shared_cache import load_shared_cache, SHARED_CACHE_TTL_SECONDS
+from prewarm import SearchHeatmap, PrewarmScheduler, PREWARM_ENABLED
+from profiling import register_profiling, is_admin_request
+from dedupe import dedupe_places, DEDUPE_ENABLED
+from upstream_replay import install_upstream_mode
+import metrics
 # --- CONFIGURATION ---
 dotenv.load_dotenv()
-app = Flask(__name__)
-CORS(app)
 
-# API Key validation
+# API Keys
 GEMINI_API_KEY_FROM_ENV = os.getenv('GEMINI_API_KEY')
 GOOGLE_PLACES_API_KEY_FROM_ENV = os.getenv('GOOGLE_PLACES_API_KEY')
 
@@ -25,41 +30,220 @@ GOOGLE_PLACES_API_KEY_FROM_ENV = os.getenv('GOOGLE_PLACES_API_KEY')
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not all([GEMINI_API_KEY_FROM_ENV, GOOGLE_PLACES_API_KEY_FROM_ENV, SUPABASE_URL, SUPABASE_KEY]):
-    raise ValueError("All API keys and Supabase credentials must be set in the .env file.")
+# Cache storage backend: 'supabase' (default) or 'sqlite' (see cache_store.py)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "supabase")
 
-# NEW: Initialize the Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Clients are created on first use unless LAZY_INIT=0, so a fresh worker can serve sooner
+LAZY_INIT = os.getenv("LAZY_INIT", "1") == "1"
+
+# Batch endpoint limits. Misses are searched BATCH_MAX_WORKERS at a time and a Places search
+# can take ~4s with its next-page wait, so 16 items (two waves) fit in the request budget
+BATCH_MAX_ITEMS = 16
+BATCH_MAX_WORKERS = 8
+# Share of the request budget the Places searches may use; the rest is kept for Gemini
+BATCH_SEARCH_BUDGET_SHARE = 0.6
+# Places per Gemini call; larger prompts risk hitting Gemini's output limit
+GEMINI_CHUNK_SIZE = 100
+
+# Static tile serving mode: answer exported searches from tiles, anything else from the live path (see export_tiles.py)
+TILE_DIR = os.getenv('TILE_DIR')
 # --- END CONFIGURATION ---
 
+api = Blueprint('api', __name__)
 
-def save_to_supabase_async(lat, lon, search_type, gemini_result, city_name=None):
-    """Saves a single search record to the Supabase 'search_live' table."""
-    try:
-        data_to_save = {
-            'latitude': lat,
-            'longitude': lon,
-            'search_type': search_type,
-            'results': gemini_result
-        }
-        # If a city_name is provided, convert it to lowercase and add it
-        if city_name:
-            data_to_save['city_name'] = city_name.lower()
-        
-        response = supabase.table('search_live').insert(data_to_save).execute()
+# --- LAZILY CREATED CLIENTS ---
+_clients = {}
+_clients_lock = threading.Lock()
 
-        if response.data:
-            print(f"Successfully saved search (lat: {lat}, lon: {lon}, city: {city_name}) to Supabase.")
-        else:
-            print(f"Failed to save search to Supabase. Response: {response.error}")
 
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None and name not in _clients:
+        with _clients_lock:
+            if name not in _clients:
+                _clients[name] = factory()
+            client = _clients[name]
+    return client
+
+
+def _create_supabase():
+    if not (SUPABASE_URL and SUPABASE_KEY):
+        return None
+    # Deferred: the supabase stack is the slowest import and only needed once we talk to it
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+def get_supabase():
+    """The Supabase client, or None when no credentials are configured (SQLite cache backend)."""
+    return _get_or_create('supabase', _create_supabase)
+
+
+def get_cache_store():
+    return _get_or_create('cache_store', lambda: create_cache_store(CACHE_BACKEND, supabase=get_supabase() if CACHE_BACKEND == 'supabase' else None))
+
+
+def get_tile_store():
+    """The static TileStore, or None when tile serving mode is off."""
+    return _get_or_create('tile_store', lambda: load_tile_store(TILE_DIR, max_age_days=CACHE_TTL_DAYS))
+
+
+def get_shared_cache():
+    """The cross-worker SharedResponseCache, or None unless SHARED_CACHE_ENABLED=1."""
+    return _get_or_create('shared_cache', load_shared_cache)
+
+
+def validate_config():
+    if not all([GEMINI_API_KEY_FROM_ENV, GOOGLE_PLACES_API_KEY_FROM_ENV]):
+        raise ValueError("All API keys must be set in the .env file.")
+    if CACHE_BACKEND == "supabase" and not all([SUPABASE_URL, SUPABASE_KEY]):
+        raise ValueError("Supabase credentials must be set in the .env file when CACHE_BACKEND is 'supabase'.")
+
+
+def save_to_cache_async(lat, lon, search_type, gemini_result, city_name=None):
+    """Saves a single search record to the configured cache backend."""
+    try:
+        get_cache_store().save(lat, lon, search_type, gemini_result, city_name)
     except Exception as e:
-        print(f"Error saving data to Supabase in background thread: {e}")
+        print(f"Error saving data to cache in background thread: {e}")
         traceback.print_exc()
 
 
+def places_payload(places, type_, stale=False):
+    """Response body for one search. Empty results, fresh or negatively cached, are reported as not found."""
+    if not places:
+        return {"error": f"No {type_} found matching your criteria."}
+    payload = {"raw_data": places}
+    if stale:
+        payload["stale"] = True
+    return payload
+
+
+def places_response(places, type_, stale=False, shared_key=None):
+    """
+    JSON response for one search. With a `shared_key` the serialized body is also stored in
+    the cross-worker shared cache, so other workers can return it without any lookups.
+    """
+    payload = places_payload(places, type_, stale)
+    status = 404 if "error" in payload else 200
+    shared_cache = get_shared_cache() if shared_key and not stale else None
+    if shared_cache is None:
+        return jsonify(payload), status
+
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    # Negative entries follow the store's shorter TTL
+    ttl_seconds = SHARED_CACHE_TTL_SECONDS if places else min(SHARED_CACHE_TTL_SECONDS, NEGATIVE_CACHE_TTL_HOURS * 3600)
+    try:
+        shared_cache.put(shared_key, status, body, ttl_seconds)
+    except Exception as e:
+        print(f"Error writing to shared cache: {e}")
+    return Response(body, status=status, mimetype='application/json')
+
+
+def shared_cache_key(lat, lon, type_, city=None):
+    # Coordinates rounded to ~100m so nearby repeats of the same search share an entry
+    return f"get-restaurants|{type_}|{(city or '').strip().lower()}|{round(lat, 3)}|{round(lon, 3)}"
+
+
+def dedupe(places_list):
+    """Fuzzy de-duplication of a Places result list (see dedupe.py), with its stats in the metrics."""
+    if not DEDUPE_ENABLED or not places_list:
+        return places_list
+    places_list, stats = dedupe_places(places_list)
+    metrics.increment('dedupe.merged', stats['merged'])
+    metrics.increment('dedupe.comparisons', stats['comparisons'])
+    if stats['merged']:
+        print(f"DEDUPE: merged {stats['merged']} of {stats['input']} places "
+              f"({stats['comparisons']} comparisons in {stats['elapsed_ms']}ms).")
+    return places_list
+
+
+def enrich_places(places_list, categorization, lat=None, lon=None):
+    """Combines Places results with their gf_status, drops unclear ones and sorts the list."""
+    # Step 3: Combine data, add gf_status, and filter
+    enriched_places = []
+    for place in places_list:
+        place_id = place.get('place_id')
+        status = categorization.get(place_id, 'Offers GF')
+        if status != 'Status Unclear':
+            place['gf_status'] = status
+            enriched_places.append(place)
+
+    # Step 4: Sort the final list
+    if lat is not None and lon is not None:
+         enriched_places.sort(key=lambda p: (0 if p.get('gf_status') == 'Dedicated GF' else 1, p.get('distance', 999)))
+    else:
+        enriched_places.sort(key=lambda p: (0 if p.get('gf_status') == 'Dedicated GF' else 1))
+    return enriched_places
+
+
+def categorize_places(places_list, type_, city=None, deadline=None):
+    """
+    Gemini categorization with a local fallback for any place Gemini didn't categorize.
+    Returns (categorization, degraded); degraded means Gemini returned nothing at all.
+    """
+    categorization = categorize_places_with_gemini(api_key=GEMINI_API_KEY_FROM_ENV, places_list=places_list, type_=type_, city_name=city, deadline=deadline,
+                                                   on_entry=lambda place_id, gf_status: metrics.increment('gemini.streamed_entries'))
+    degraded = not categorization
+    missing = [p for p in places_list if p['place_id'] not in categorization]
+    if missing:
+        # Gemini failed, timed out or its breaker is open, or some entries never came back:
+        # classify those places by name/types instead
+        if degraded:
+            print("Gemini unavailable. Falling back to local categorization.")
+        else:
+            print(f"Gemini left {len(missing)} places uncategorized. Classifying them locally.")
+        categorization = {**classify_places_locally(missing), **categorization}
+    return categorization, degraded
+
+
+def fetch_fresh_results(lat, lon, type_, city=None, country=None, deadline=None):
+    """
+    Runs the upstream pipeline (Google Places, then Gemini) for one search.
+    Returns (enriched_places, degraded); enriched_places is None when Google found nothing.
+    Raises UpstreamUnavailable when Places can't be reached within the deadline.
+    """
+    # Step 1: Get the full list of places from Google
+    places_list = dedupe(find_places(api_key=GOOGLE_PLACES_API_KEY_FROM_ENV, type_=type_, city_name=city, country_filter=country, lat=lat, lon=lon, deadline=deadline))
+
+    if not places_list:
+        return None, False
+
+    # Step 2: Get the categorization for the list from Gemini
+    categorization, degraded = categorize_places(places_list, type_, city, deadline)
+    return enrich_places(places_list, categorization, lat, lon), degraded
+
+
+def fetch_fresh_results_multi(lat, lon, types, city=None, country=None, deadline=None):
+    """
+    Multi-type variant of fetch_fresh_results: one broad Places query split by Google types and
+    one Gemini call for every place. Returns ({type: enriched_places or None}, degraded).
+    """
+    places_by_type = find_places(api_key=GOOGLE_PLACES_API_KEY_FROM_ENV, type_=types[0], city_name=city, country_filter=country, lat=lat, lon=lon, deadline=deadline, types=types)
+
+    places_by_type = {type_: dedupe(places) for type_, places in places_by_type.items()}
+    unique_places = {p['place_id']: p for places in places_by_type.values() for p in places}
+    if not unique_places:
+        return {type_: None for type_ in types}, False
+
+    categorization, degraded = categorize_places(list(unique_places.values()), ", ".join(types), city, deadline)
+    return {type_: enrich_places(places, categorization, lat, lon) if places else None
+            for type_, places in places_by_type.items()}, degraded
+
+
+def prewarm_refresh(lat, lon, type_, city=None):
+    """Refresh callback for the pre-warm scheduler: fetch and cache synchronously (we're already in the background)."""
+    enriched_places, degraded = fetch_fresh_results(lat, lon, type_, city, deadline=Deadline())
+    if enriched_places and not degraded:
+        get_cache_store().save(lat, lon, type_, enriched_places, city)
+
+
+# Traffic heatmap; create_app() starts the scheduler that keeps its hottest cells warm
+search_heatmap = SearchHeatmap()
+
+
 # NEW: Route to find coordinates for a city
-@app.route('/find-city-coordinates', methods=['GET'])
+@api.route('/find-city-coordinates', methods=['GET'])
 def find_city_coordinates_route():
     city_name = request.args.get('city')
     if not city_name:
@@ -73,10 +257,18 @@ def find_city_coordinates_route():
         "key": GOOGLE_PLACES_API_KEY_FROM_ENV
     }
 
+    breaker = get_breaker('places')
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-        data = response.json()
+        breaker.check()
+        try:
+            response = requests.get(url, params=params, timeout=10)
+            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+            data = response.json()
+        except Exception:
+            breaker.record_failure()
+            raise
+        else:
+            breaker.record_success()
 
         if data.get("status") == "OK" and data.get("candidates"):
             location = data["candidates"][0]["geometry"]["location"]
@@ -84,6 +276,9 @@ def find_city_coordinates_route():
         else:
             return jsonify({"error": f"Could not find coordinates for city: {city_name}"}), 404
 
+    except UpstreamUnavailable as e:
+        print(f"Google Places API unavailable: {e}")
+        return jsonify({"error": "Google Places API is temporarily unavailable."}), 503
     except requests.exceptions.RequestException as e:
         print(f"Error calling Google Places API: {e}")
         return jsonify({"error": "Failed to communicate with Google Places API."}), 500
@@ -94,13 +289,16 @@ def find_city_coordinates_route():
 
 
 # NEW: Route to submit user feedback
-@app.route('/submit-feedback', methods=['POST'])
+@api.route('/submit-feedback', methods=['POST'])
 def submit_feedback_route():
     data = request.get_json()
     content = data.get('content')
 
     if not content:
         return jsonify({"error": "Feedback content is required."}), 400
+    supabase = get_supabase()
+    if supabase is None:
+        return jsonify({"error": "Feedback is not available on this server."}), 503
 
     try:
         response = supabase.table('feedback').insert({"content": content}).execute()
@@ -119,7 +317,7 @@ def submit_feedback_route():
 # In app.py
 
 # --- MAIN API ROUTE ---
-@app.route('/get-restaurants', methods=['GET'])
+@api.route('/get-restaurants', methods=['GET'])
 def get_establishments_route():
     # Get parameters from the request URL
     city = request.args.get('city')
@@ -131,41 +329,61 @@ def get_establishments_route():
     if lat is None or lon is None:
         return jsonify({"error": "Latitude and longitude are required."}), 400
 
+    # Multi-type mode: ?types=restaurants,cafes,bakery shares one upstream fetch between the types
+    types_param = request.args.get('types')
+    if types_param:
+        # Only the app's own filters, each once, so one request costs at most len(GOOGLE_TYPES_BY_FILTER) searches
+        types = list(dict.fromkeys(t.strip() for t in types_param.split(',') if t.strip()))
+        if not types:
+            return jsonify({"error": "At least one type is required."}), 400
+        unknown = [t for t in types if t not in GOOGLE_TYPES_BY_FILTER]
+        if unknown:
+            return jsonify({"error": f"Unsupported types: {', '.join(unknown)}. Supported: {', '.join(GOOGLE_TYPES_BY_FILTER)}."}), 400
+        try:
+            return get_multi_type_response(lat, lon, types, city, country)
+        except Exception as e:
+            print(f"Critical error in multi-type /get-establishments route: {e}")
+            traceback.print_exc()
+            return jsonify({"error": "An unexpected server error occurred."}), 500
+
+    search_heatmap.record(lat, lon, type_, city)
+
+    # --- STATIC TILES: answered from mmap'd files, zero database queries ---
+    tile_store = get_tile_store()
+    if tile_store is not None:
+        try:
+            tile_places = tile_store.lookup(lat, lon, type_, city)
+            if tile_places is not None:
+                print(f"TILE HIT! Returning static data for type: {type_} at lat: {lat}, lon: {lon}")
+                metrics.increment('tiles.hits')
+                return places_response(tile_places, type_)
+        except Exception as e:
+            print(f"Error reading static tiles, falling back to live path. Error: {e}")
+
+    # --- SHARED CACHE: a response already built by any worker on this host ---
+    shared_key = shared_cache_key(lat, lon, type_, city)
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        try:
+            shared_hit = shared_cache.get(shared_key)
+            if shared_hit is not None:
+                metrics.increment('shared_cache.hits')
+                status, body = shared_hit
+                return Response(body, status=status, mimetype='application/json')
+            metrics.increment('shared_cache.misses')
+        except Exception as e:
+            print(f"Error reading shared cache, falling back to the cache store. Error: {e}")
+
 # --- UPDATED CACHE CHECKING LOGIC ---
+    deadline = Deadline()
     try:
-        # Step 1: Check for a cached result by city name if provided
-        if city:
-            print(f"Checking cache for city: '{city}' and type: '{type_}'")
-            
-            # Calculate the timestamp for 7 days ago
-            seven_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
-            
-            # Query for a case-insensitive city name and type match within the last 7 days
-            #cached_city_search = supabase.table('search_live').select('results').ilike('city_name', city).eq('search_type', type_).gte('created_at', seven_days_ago).limit(1).execute()
-            cached_city_search = supabase.table('search_live').select('results').ilike('city_name', f'%{city.lower()}%').eq('search_type', type_).gte('created_at', seven_days_ago).limit(1).execute()
-            
-            if cached_city_search.data:
-                print(f"CITY CACHE HIT! Returning data for '{city}'.")
-                return jsonify({"raw_data": cached_city_search.data[0]['results']})
-
-        # Step 2: If no city cache hit, fall back to GPS proximity check
-        print(f"Checking GPS cache for type: {type_} at lat: {lat}, lon: {lon}")
-        cached_response = supabase.rpc(
-            'find_nearby_searches',
-            {
-                'request_lat': lat,
-                'request_lon': lon,
-                'request_type': type_,
-                'radius_meters': 500
-            }
-        ).execute()
-
-        if cached_response.data:
-            print("GPS PROXIMITY CACHE HIT! Returning data from Supabase.")
-            cached_places = cached_response.data[0]['results']
-            return jsonify({"raw_data": cached_places})
+        cached_places = get_cache_store().lookup(lat, lon, type_, city)
+        if cached_places is not None:
+            metrics.increment('cache.hits' if cached_places else 'cache.negative_hits')
+            return places_response(cached_places, type_, shared_key=shared_key)
 
         print("CACHE MISS. Fetching fresh data from APIs...")
+        metrics.increment('cache.misses')
 
     except Exception as e:
         print(f"Error checking cache, proceeding to fetch fresh data. Error: {e}")
@@ -173,47 +391,301 @@ def get_establishments_route():
 
 
     try:
-        # Step 1: Get the full list of places from Google
-        places_list = find_places(api_key=GOOGLE_PLACES_API_KEY_FROM_ENV, type_=type_, city_name=city, country_filter=country, lat=lat, lon=lon)
-
-        if not places_list:
-            return jsonify({"error": f"No {type_} found matching your criteria."}), 404
-
-        # Step 2: Get the categorization for the list from Gemini
-        categorization = categorize_places_with_gemini(api_key=GEMINI_API_KEY_FROM_ENV, places_list=places_list, type_=type_, city_name=city)
-
-        # Step 3: Combine data, add gf_status, and filter
-        enriched_places = []
-        for place in places_list:
-            place_id = place.get('place_id')
-            status = categorization.get(place_id, 'Offers GF')
-            if status != 'Status Unclear':
-                place['gf_status'] = status
-                enriched_places.append(place)
-        
-        # Step 4: Sort the final list
-        if lat is not None and lon is not None:
-             enriched_places.sort(key=lambda p: (0 if p.get('gf_status') == 'Dedicated GF' else 1, p.get('distance', 999)))
-        else:
-            enriched_places.sort(key=lambda p: (0 if p.get('gf_status') == 'Dedicated GF' else 1))
-
-        # --- Save the new results to Supabase in the background ---
-        if enriched_places:
+        enriched_places, degraded = fetch_fresh_results(lat, lon, type_, city, country, deadline)
+
+        # --- Save the new results to the cache in the background ---
+        # Degraded results are served but not cached, so the next request retries Gemini.
+        # Empty outcomes are saved as [] so repeats don't call Google again (shorter TTL).
+        if not degraded:
+            if not enriched_places:
+                metrics.increment('cache.negative_stored')
             save_thread = threading.Thread(
-                target=save_to_supabase_async,
-                args=(lat, lon, type_, enriched_places,city)
+                target=save_to_cache_async,
+                args=(lat, lon, type_, enriched_places or [], city)
             )
             save_thread.start()
         # --- END ---
 
-        return jsonify({"raw_data": enriched_places})
+        return places_response(enriched_places, type_, shared_key=None if degraded else shared_key)
+
+    except UpstreamUnavailable as e:
+        # Places is down or the budget ran out: serve a stale cached answer if we have one
+        print(f"Upstream unavailable ({e}). Looking for a stale cached result...")
+        try:
+            stale_places = get_cache_store().lookup(lat, lon, type_, city, max_age_days=None)
+            if stale_places is not None:
+                return places_response(stale_places, type_, stale=True)
+        except Exception as cache_error:
+            print(f"Error reading stale cache: {cache_error}")
+        return jsonify({"error": "Our data providers are temporarily unavailable. Please try again shortly."}), 503
 
     except Exception as e:
         print(f"Critical error in /get-establishments route: {e}")
         traceback.print_exc()
         return jsonify({"error": "An unexpected server error occurred."}), 500
 
+def get_multi_type_response(lat, lon, types, city=None, country=None):
+    """
+    Answers several types for one location: cached types are served from the cache, and all the
+    remaining types are fetched together, with a query of their own for any type the shared query
+    found nothing for. Returns {"results": {type: {"raw_data": [...]} or {"error": ...}}}.
+    """
+    results = {}
+    for type_ in types:
+        search_heatmap.record(lat, lon, type_, city)
+
+    tile_store = get_tile_store()
+    missing = []
+    for type_ in types:
+        tile_places = None
+        if tile_store is not None:
+            try:
+                tile_places = tile_store.lookup(lat, lon, type_, city)
+            except Exception as e:
+                print(f"Error reading static tiles, falling back to live path. Error: {e}")
+        if tile_places is not None:
+            metrics.increment('tiles.hits')
+            results[type_] = places_payload(tile_places, type_)
+        else:
+            missing.append(type_)
+
+    if missing:
+        try:
+            cached = get_cache_store().lookup_many([(lat, lon, type_, city) for type_ in missing])
+            for type_, cached_places in zip(missing, cached):
+                if cached_places is not None:
+                    metrics.increment('cache.hits' if cached_places else 'cache.negative_hits')
+                    results[type_] = places_payload(cached_places, type_)
+        except Exception as e:
+            print(f"Error checking cache, fetching all types fresh. Error: {e}")
+        missing = [type_ for type_ in missing if type_ not in results]
+
+    if not missing:
+        return jsonify({"results": results})
+
+    print(f"MULTI-TYPE: fetching {missing} with a single upstream query...")
+    metrics.increment('cache.misses', len(missing))
+    deadline = Deadline()
+    try:
+        enriched_by_type, degraded = fetch_fresh_results_multi(lat, lon, missing, city, country, deadline)
+    except UpstreamUnavailable as e:
+        print(f"Upstream unavailable ({e}). Looking for stale cached results...")
+        for type_ in missing:
+            try:
+                stale_places = get_cache_store().lookup(lat, lon, type_, city, max_age_days=None)
+            except Exception as cache_error:
+                print(f"Error reading stale cache: {cache_error}")
+                stale_places = None
+            results[type_] = places_payload(stale_places, type_, stale=True) if stale_places is not None \
+                else {"error": "Our data providers are temporarily unavailable. Please try again shortly."}
+        return jsonify({"results": results})
+
+    # An empty list from the broad query doesn't show what the type's own search would find,
+    # so those types are queried on their own. Only their answers may be cached as negative.
+    empty = [type_ for type_, places in enriched_by_type.items() if not places]
+    refetched = {}
+    if empty:
+        print(f"MULTI-TYPE: {empty} came back empty from the broad query, querying them on their own...")
+        metrics.increment('multi_type.refetches', len(empty))
+
+        def refetch(type_):
+            try:
+                return type_, fetch_fresh_results(lat, lon, type_, city, country, deadline)
+            except UpstreamUnavailable as e:
+                print(f"Per-type query for {type_} unavailable ({e}); serving the broad query's list uncached.")
+                return type_, None
+
+        with ThreadPoolExecutor(max_workers=len(empty)) as executor:
+            refetched = {type_: outcome for type_, outcome in executor.map(refetch, empty) if outcome is not None}
+
+    # Each type's list is cached separately, exactly as if it had been fetched on its own
+    to_save = []
+    for type_, enriched_places in enriched_by_type.items():
+        type_degraded = degraded
+        if type_ in refetched:
+            enriched_places, type_degraded = refetched[type_]
+        elif type_ in empty:
+            type_degraded = True  # the per-type query failed; don't cache a list it never confirmed
+        results[type_] = places_payload(enriched_places, type_)
+        if not type_degraded:
+            if not enriched_places:
+                metrics.increment('cache.negative_stored')
+            to_save.append((lat, lon, type_, enriched_places or [], city))
+    if to_save:
+        threading.Thread(target=lambda: [save_to_cache_async(*args) for args in to_save]).start()
+
+    return jsonify({"results": results})
+
+
+# --- BATCH API ROUTE ---
+@api.route('/get-restaurants/batch', methods=['POST'])
+def get_establishments_batch_route():
+    """
+    Resolves many (lat, lon, type, city) lookups in one call. Body:
+        {"items": [{"id": "london-cafes", "lat": 51.5, "lon": -0.12, "type": "cafes", "city": "London"}, ...]}
+    Returns {"results": {id: {"raw_data": [...]} or {"error": "..."}}}; ids default to the item's index.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "The request body must be a JSON object."}), 400
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "A non-empty 'items' list is required."}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} items are allowed per batch."}), 400
+
+    searches, keys = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return jsonify({"error": f"Item {index} must be an object."}), 400
+        try:
+            lat, lon = float(item['lat']), float(item['lon'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": f"Item {index}: latitude and longitude are required."}), 400
+        type_ = item.get('type') or 'restaurants'
+        city, country = item.get('city'), item.get('country')
+        # These end up in dict keys and .lower() calls, so anything but a string is a 400, not a 500
+        if not isinstance(type_, str) or any(v is not None and not isinstance(v, str) for v in (city, country)):
+            return jsonify({"error": f"Item {index}: 'type', 'city' and 'country' must be strings."}), 400
+        key = str(item.get('id', index))
+        if key in keys:
+            return jsonify({"error": f"Item {index}: duplicate id '{key}'."}), 400
+        searches.append((lat, lon, type_, city, country))
+        keys.append(key)
+
+    results = {}
+    for lat, lon, type_, city, _ in searches:
+        search_heatmap.record(lat, lon, type_, city)
+
+    # Step 1: Static tiles, then every remaining cache lookup in one storage call
+    tile_store = get_tile_store()
+    pending = []
+    for i, (lat, lon, type_, city, _) in enumerate(searches):
+        try:
+            tile_places = tile_store.lookup(lat, lon, type_, city) if tile_store is not None else None
+        except Exception as e:
+            print(f"Error reading static tiles, falling back to live path. Error: {e}")
+            tile_places = None
+        if tile_places is not None:
+            metrics.increment('tiles.hits')
+            results[keys[i]] = places_payload(tile_places, searches[i][2])
+        else:
+            pending.append(i)
+
+    if pending:
+        try:
+            cached = get_cache_store().lookup_many([searches[i][:4] for i in pending])
+            for i, cached_places in zip(pending, cached):
+                if cached_places is not None:
+                    metrics.increment('cache.hits' if cached_places else 'cache.negative_hits')
+                    results[keys[i]] = places_payload(cached_places, searches[i][2])
+        except Exception as e:
+            print(f"Error checking cache for batch, fetching all items fresh. Error: {e}")
+        pending = [i for i in pending if keys[i] not in results]
+
+    if not pending:
+        return jsonify({"results": results})
+    print(f"BATCH: {len(items) - len(pending)} hits, fetching {len(pending)} misses from APIs...")
+    metrics.increment('cache.misses', len(pending))
+
+    # Step 2: Run the Places searches for the misses concurrently. They share a capped slice of
+    # the request budget so a slow wave can't leave nothing for Gemini
+    deadline = Deadline()
+    search_deadline = Deadline(deadline.remaining() * BATCH_SEARCH_BUDGET_SHARE)
+
+    def search(i):
+        lat, lon, type_, city, country = searches[i]
+        try:
+            return dedupe(find_places(api_key=GOOGLE_PLACES_API_KEY_FROM_ENV, type_=type_, city_name=city, country_filter=country, lat=lat, lon=lon, deadline=search_deadline))
+        except UpstreamUnavailable as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(pending))) as pool:
+        places_by_item = dict(zip(pending, pool.map(search, pending)))
+
+    # Step 3: Gemini categorization of every uncached place, in concurrent chunks of GEMINI_CHUNK_SIZE
+    unique_places = {}
+    for places_list in places_by_item.values():
+        if isinstance(places_list, list):
+            for place in places_list:
+                unique_places.setdefault(place['place_id'], place)
+    categorization, degraded_ids = {}, set()
+    if unique_places:
+        types = ", ".join(sorted({searches[i][2] for i in pending}))
+        places = list(unique_places.values())
+        chunks = [places[start:start + GEMINI_CHUNK_SIZE] for start in range(0, len(places), GEMINI_CHUNK_SIZE)]
+        with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(chunks))) as pool:
+            outcomes = list(pool.map(lambda chunk: categorize_places(chunk, types, deadline=deadline), chunks))
+        for chunk, (chunk_categorization, chunk_degraded) in zip(chunks, outcomes):
+            categorization.update(chunk_categorization)
+            if chunk_degraded:
+                degraded_ids.update(p['place_id'] for p in chunk)
+
+    # Step 4: Build each item's response and queue its cache save
+    to_save = []
+    for i, places_list in places_by_item.items():
+        lat, lon, type_, city, _ = searches[i]
+        if isinstance(places_list, UpstreamUnavailable):
+            try:
+                stale_places = get_cache_store().lookup(lat, lon, type_, city, max_age_days=None)
+            except Exception as cache_error:
+                print(f"Error reading stale cache: {cache_error}")
+                stale_places = None
+            results[keys[i]] = places_payload(stale_places, type_, stale=True) if stale_places is not None \
+                else {"error": "Our data providers are temporarily unavailable. Please try again shortly."}
+            continue
+
+        enriched_places = enrich_places(places_list, categorization, lat, lon) if places_list else []
+        results[keys[i]] = places_payload(enriched_places, type_)
+        # Empty outcomes are cached as negative entries; items with degraded categorizations are not cached
+        degraded = any(p['place_id'] in degraded_ids for p in places_list or [])
+        if not places_list or not degraded:
+            if not enriched_places:
+                metrics.increment('cache.negative_stored')
+            to_save.append((lat, lon, type_, enriched_places, city))
+
+    if to_save:
+        threading.Thread(target=lambda: [save_to_cache_async(*args) for args in to_save]).start()
+
+    return jsonify({"results": results})
+
+# --- ADMIN: METRICS ---
+@api.route('/admin/metrics', methods=['GET'])
+def metrics_route():
+    if not is_admin_request():
+        return jsonify({"error": "Not found."}), 404
+    return jsonify({
+        "counters": metrics.snapshot(),
+        "breakers": {name: breaker.snapshot() for name, breaker in BREAKERS.items()},
+    })
+
+
+# --- APP FACTORY ---
+def create_app():
+    """
+    Builds the Flask app. Clients are created on first use (LAZY_INIT=1, the default) so
+    importing this module and starting a worker stay cheap; LAZY_INIT=0 creates them up front.
+    """
+    validate_config()
+    # UPSTREAM_MODE=record|replay captures or replays upstream calls (see upstream_replay.py)
+    install_upstream_mode()
+    app = Flask(__name__)
+    CORS(app)
+    # Opt-in sampling profiler; see profiling.py for PROFILE_* and ADMIN_TOKEN settings
+    register_profiling(app)
+    app.register_blueprint(api)
+
+    if not LAZY_INIT:
+        get_cache_store()
+        get_tile_store()
+        get_shared_cache()
+        get_supabase()
+    if PREWARM_ENABLED:
+        PrewarmScheduler(search_heatmap, get_cache_store(), prewarm_refresh, ttl_days=CACHE_TTL_DAYS).start()
+    return app
+
+
 # --- APP RUN ---
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5007))
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,64 @@
+# bench_startup.py
+#
+# Measures cold start: how long a fresh Python process takes to import app.py, build the
+# app with create_app() and serve its first cached hit. Uses the SQLite cache backend with
+# a pre-seeded cache so no network calls are made.
+#
+#   python bench_startup.py [runs] [--eager]
+#
+# --eager sets LAZY_INIT=0 to compare against creating every client up front.
+
+import os
+import sys
+import json
+import statistics
+import subprocess
+import tempfile
+
+CHILD_SCRIPT = """
+import json, time
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+flask_app = app_module.create_app()
+t2 = time.perf_counter()
+response = flask_app.test_client().get('/get-restaurants?lat=51.5074&lon=-0.1278&type=restaurants')
+t3 = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'create_app_ms': (t2 - t1) * 1000,
+                  'first_hit_ms': (t3 - t2) * 1000, 'total_ms': (t3 - t0) * 1000}))
+"""
+
+
+def seed_cache(path):
+    from cache_store import SQLiteCacheStore
+    SQLiteCacheStore(path).save(51.5074, -0.1278, 'restaurants',
+                                [{"name": "Benchmark Cafe", "place_id": "bench", "gf_status": "Offers GF"}])
+
+
+def run_benchmark(runs, eager=False):
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    cache_path = os.path.join(workdir, 'cache.sqlite3')
+    seed_cache(cache_path)
+
+    env = dict(os.environ,
+               CACHE_BACKEND='sqlite', SQLITE_CACHE_PATH=cache_path,
+               GEMINI_API_KEY=os.getenv('GEMINI_API_KEY', 'benchmark'),
+               GOOGLE_PLACES_API_KEY=os.getenv('GOOGLE_PLACES_API_KEY', 'benchmark'),
+               LAZY_INIT='0' if eager else '1', PREWARM_ENABLED='0')
+
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', CHILD_SCRIPT], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True)
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    print(f"Cold start over {runs} fresh processes ({'eager' if eager else 'lazy'} init):")
+    for phase in ('import_ms', 'create_app_ms', 'first_hit_ms', 'total_ms'):
+        values = [s[phase] for s in samples]
+        print(f"  {phase:<14} median {statistics.median(values):8.1f}   min {min(values):8.1f}   max {max(values):8.1f}")
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    run_benchmark(int(args[0]) if args else 5, eager='--eager' in sys.argv)
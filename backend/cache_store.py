@@ -0,0 +1,455 @@
+# cache_store.py
+#
+# Storage backends for cached search results. app.py only talks to the CacheStore
+# interface, so the backend can run against Supabase (production) or an embedded
+# SQLite file (local runs, load tests, edge deployments).
+#
+# Storage is normalized: each place is stored once in a `places` table keyed by place_id,
+# and each search row keeps only `place_refs`, an ordered list of [place_id, distance].
+# Saves upsert only the places whose content changed; reads assemble the response with a
+# single batched lookup by id.
+
+import os
+import json
+import hashlib
+import math
+import time
+import sqlite3
+import threading
+import unicodedata
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from find_places import calculate_distance
+
+CACHE_TTL_DAYS = 30
+# Empty results ("nothing found here") are cached too, but expire much sooner
+NEGATIVE_CACHE_TTL_HOURS = float(os.getenv('NEGATIVE_CACHE_TTL_HOURS', 24))
+PROXIMITY_RADIUS_METERS = 500
+
+
+def normalize_city_key(city_name):
+    """'São Paulo, Brazil ' -> 'sao paulo brazil'. Used for indexed city lookups."""
+    text = unicodedata.normalize('NFKD', city_name).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+
+class CacheStore:
+    """Interface for cache backends."""
+
+    def lookup(self, lat, lon, search_type, city_name=None, max_age_days=CACHE_TTL_DAYS):
+        """
+        Returns cached results for a search, trying the city name first and then GPS proximity.
+        Pass max_age_days=None to accept stale entries (used when upstreams are unavailable).
+        """
+        raise NotImplementedError
+
+    def save(self, lat, lon, search_type, results, city_name=None):
+        """Stores the results of a search. An empty list is a negative entry with its own, shorter TTL."""
+        raise NotImplementedError
+
+    def entry_age_days(self, lat, lon, search_type, city_name=None):
+        """Age in days of the newest entry that would answer this search, or None if there is none."""
+        raise NotImplementedError
+
+    def lookup_many(self, searches, max_age_days=CACHE_TTL_DAYS):
+        """
+        Looks up several (lat, lon, search_type, city_name) searches at once.
+        Returns a list aligned with `searches`, holding cached results or None.
+        """
+        return [self.lookup(lat, lon, search_type, city_name, max_age_days) for lat, lon, search_type, city_name in searches]
+
+
+def _age_days_from_timestamp(created_at):
+    """Supabase returns ISO-8601 timestamps, e.g. '2025-06-01T12:00:00.123+00:00'."""
+    if not created_at:
+        return None
+    created = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - created).total_seconds() / 86400
+
+
+# --- Normalized Storage Helpers ---
+
+def place_content_hash(place):
+    return hashlib.sha1(json.dumps(place, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def split_results(results):
+    """
+    Splits an enriched result list into ({place_id: place}, [[place_id, distance], ...]).
+    `distance` depends on where the search was made, so it lives on the search, not the place.
+    """
+    places_by_id, place_refs = {}, []
+    for place in results:
+        place_data = {k: v for k, v in place.items() if k != 'distance'}
+        places_by_id[place['place_id']] = place_data
+        place_refs.append([place['place_id'], place.get('distance')])
+    return places_by_id, place_refs
+
+
+def assemble_results(place_refs, places_by_id):
+    """Inverse of split_results. Places missing from the store are skipped."""
+    results = []
+    for place_id, distance in place_refs:
+        place = places_by_id.get(place_id)
+        if place is not None:
+            results.append({**place, 'distance': distance})
+    return results
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _row_is_negative(row):
+    """Search rows carry `place_refs`; rows written before normalization carry a `results` blob."""
+    place_refs = row.get('place_refs')
+    return not place_refs if place_refs is not None else not row.get('results')
+
+
+def _within_age(rows, max_age_days):
+    """Drops rows older than `max_age_days` (None keeps everything, for stale fallbacks)."""
+    if max_age_days is None:
+        return rows
+    return [row for row in rows
+            if (age_days := _age_days_from_timestamp(row.get('created_at'))) is None or age_days <= max_age_days]
+
+
+def _first_usable(rows):
+    """First row, newest first, that may be served: negative entries only until NEGATIVE_CACHE_TTL_HOURS."""
+    for row in rows:
+        if not _row_is_negative(row):
+            return row
+        age_days = _age_days_from_timestamp(row.get('created_at'))
+        if age_days is not None and age_days * 24 < NEGATIVE_CACHE_TTL_HOURS:
+            return row
+    return None
+
+
+# --- Supabase Backend ---
+
+class SupabaseCacheStore(CacheStore):
+    """The `search_live` table plus the `find_nearby_searches` RPC for proximity lookups."""
+
+    PLACES_LOOKUP_CHUNK = 200  # keeps the `in.(...)` filter well within URL limits
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def resolve_results(self, rows):
+        """Fills row['results'] for normalized rows, with one batched `places` lookup per chunk of ids."""
+        # Sorted, not set order (which varies with PYTHONHASHSEED), so recorded request URLs replay
+        place_ids = sorted({ref[0] for row in rows if row.get('place_refs') for ref in row['place_refs']})
+        places_by_id = {}
+        for chunk in _chunks(place_ids, self.PLACES_LOOKUP_CHUNK):
+            response = self.supabase.table('places').select('place_id, data').in_('place_id', chunk).execute()
+            places_by_id.update({r['place_id']: r['data'] for r in response.data or []})
+        for row in rows:
+            if row.get('place_refs') is not None:
+                row['results'] = assemble_results(row['place_refs'], places_by_id)
+        return rows
+
+    def upsert_places(self, places_by_id):
+        """Writes only the places whose content hash changed. Returns the number written."""
+        place_ids = list(places_by_id)
+        existing = {}
+        for chunk in _chunks(place_ids, self.PLACES_LOOKUP_CHUNK):
+            response = self.supabase.table('places').select('place_id, content_hash').in_('place_id', chunk).execute()
+            existing.update({r['place_id']: r['content_hash'] for r in response.data or []})
+
+        changed = []
+        for place_id, place in places_by_id.items():
+            content_hash = place_content_hash(place)
+            if existing.get(place_id) != content_hash:
+                changed.append({'place_id': place_id, 'data': place, 'content_hash': content_hash,
+                                'updated_at': datetime.now(timezone.utc).isoformat()})
+        if changed:
+            self.supabase.table('places').upsert(changed).execute()
+        return len(changed)
+
+    def lookup(self, lat, lon, search_type, city_name=None, max_age_days=CACHE_TTL_DAYS):
+        # Step 1: Check for a cached result by city name if provided
+        if city_name:
+            print(f"Checking cache for city: '{city_name}' and type: '{search_type}'")
+            query = self.supabase.table('search_live').select('results, place_refs, created_at').ilike('city_name', f'%{city_name.lower()}%').eq('search_type', search_type)
+            if max_age_days is not None:
+                query = query.gte('created_at', (datetime.now() - timedelta(days=max_age_days)).isoformat())
+            # A few rows, in case the newest is an expired negative entry
+            cached_city_search = query.order('created_at', desc=True).limit(3).execute()
+
+            row = _first_usable(cached_city_search.data or [])
+            if row:
+                print(f"CITY CACHE HIT! Returning data for '{city_name}'.")
+                return self.resolve_results([row])[0]['results']
+
+        # Step 2: If no city cache hit, fall back to GPS proximity check
+        print(f"Checking GPS cache for type: {search_type} at lat: {lat}, lon: {lon}")
+        cached_response = self.supabase.rpc(
+            'find_nearby_searches',
+            {
+                'request_lat': lat,
+                'request_lon': lon,
+                'request_type': search_type,
+                'radius_meters': PROXIMITY_RADIUS_METERS
+            }
+        ).execute()
+
+        row = _first_usable(_within_age(cached_response.data or [], max_age_days))
+        if row:
+            print("GPS PROXIMITY CACHE HIT! Returning data from Supabase.")
+            return self.resolve_results([row])[0]['results']
+
+        return None
+
+    def lookup_many(self, searches, max_age_days=CACHE_TTL_DAYS):
+        matched_rows = [None] * len(searches)
+
+        # City searches are resolved together in a single query, newest rows first
+        city_searches = [(i, s) for i, s in enumerate(searches) if s[3]]
+        if city_searches:
+            # Double quotes let city names containing commas through PostgREST's or() syntax
+            city_filter = ','.join(f'city_name.ilike."*{s[3].lower()}*"' for _, s in city_searches)
+            query = self.supabase.table('search_live').select('city_name, search_type, results, place_refs, created_at') \
+                .in_('search_type', sorted({s[2] for _, s in city_searches})).or_(city_filter)
+            if max_age_days is not None:
+                query = query.gte('created_at', (datetime.now() - timedelta(days=max_age_days)).isoformat())
+            rows = query.order('created_at', desc=True).execute().data or []
+            for i, (_, _, search_type, city_name) in city_searches:
+                city_key = city_name.lower()
+                matched_rows[i] = _first_usable(r for r in rows if r['search_type'] == search_type and city_key in (r.get('city_name') or ''))
+
+        # The remaining searches need the proximity RPC, which takes one location per call
+        pending = [i for i, row in enumerate(matched_rows) if row is None]
+        if pending:
+            def nearby(i):
+                lat, lon, search_type, _ = searches[i]
+                return self.supabase.rpc('find_nearby_searches', {
+                    'request_lat': lat, 'request_lon': lon,
+                    'request_type': search_type, 'radius_meters': PROXIMITY_RADIUS_METERS
+                }).execute().data
+            with ThreadPoolExecutor(max_workers=min(8, len(pending))) as pool:
+                for i, data in zip(pending, pool.map(nearby, pending)):
+                    matched_rows[i] = _first_usable(_within_age(data or [], max_age_days))
+
+        # One batched places lookup assembles every hit
+        self.resolve_results([row for row in matched_rows if row is not None])
+        results = [row['results'] if row is not None else None for row in matched_rows]
+        print(f"Batch cache lookup: {sum(r is not None for r in results)}/{len(searches)} hits.")
+        return results
+
+    def save(self, lat, lon, search_type, results, city_name=None):
+        places_by_id, place_refs = split_results(results)
+        changed_count = self.upsert_places(places_by_id) if places_by_id else 0
+
+        data_to_save = {
+            'latitude': lat,
+            'longitude': lon,
+            'search_type': search_type,
+            'place_refs': place_refs
+        }
+        # If a city_name is provided, convert it to lowercase and add it
+        if city_name:
+            data_to_save['city_name'] = city_name.lower()
+
+        response = self.supabase.table('search_live').insert(data_to_save).execute()
+
+        if response.data:
+            print(f"Successfully saved search (lat: {lat}, lon: {lon}, city: {city_name}) to Supabase "
+                  f"({changed_count}/{len(places_by_id)} places written).")
+        else:
+            print(f"Failed to save search to Supabase. Response: {response.error}")
+
+    def entry_age_days(self, lat, lon, search_type, city_name=None):
+        if city_name:
+            response = self.supabase.table('search_live').select('created_at').ilike('city_name', f'%{city_name.lower()}%') \
+                .eq('search_type', search_type).order('created_at', desc=True).limit(1).execute()
+            if response.data:
+                return _age_days_from_timestamp(response.data[0].get('created_at'))
+
+        response = self.supabase.rpc(
+            'find_nearby_searches',
+            {
+                'request_lat': lat,
+                'request_lon': lon,
+                'request_type': search_type,
+                'radius_meters': PROXIMITY_RADIUS_METERS
+            }
+        ).execute()
+        if response.data:
+            return _age_days_from_timestamp(response.data[0].get('created_at'))
+        return None
+
+
+# --- SQLite Backend ---
+
+class SQLiteCacheStore(CacheStore):
+    """
+    Embedded cache: an R*Tree index answers radius queries and an index on the normalized
+    city key answers city lookups. WAL mode lets request threads read while a save is in progress.
+    """
+
+    # Bump when the schema changes. Older local caches are dropped and rebuilt; it's only a cache.
+    SCHEMA_VERSION = 2
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS places (
+            place_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS search_live (
+            id INTEGER PRIMARY KEY,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            search_type TEXT NOT NULL,
+            city_name TEXT,
+            city_key TEXT,
+            place_refs TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_search_live_city ON search_live (search_type, city_key, created_at);
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_live_rtree USING rtree (id, min_lat, max_lat, min_lon, max_lon);
+    """
+    SQL_VARIABLE_CHUNK = 500  # stay under SQLite's bound-parameter limit
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        if conn.execute('PRAGMA user_version').fetchone()[0] < self.SCHEMA_VERSION:
+            conn.executescript("DROP TABLE IF EXISTS search_live; DROP TABLE IF EXISTS search_live_rtree;")
+            conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+        conn.executescript(self.SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections can't be shared across threads; each request thread gets its own
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, lat, lon, search_type, city_name=None, max_age_days=CACHE_TTL_DAYS):
+        return self.lookup_many([(lat, lon, search_type, city_name)], max_age_days)[0]
+
+    def lookup_many(self, searches, max_age_days=CACHE_TTL_DAYS):
+        min_created_at = time.time() - max_age_days * 86400 if max_age_days is not None else 0
+        refs_per_search = []
+        for lat, lon, search_type, city_name in searches:
+            row = self._find(lat, lon, search_type, city_name, min_created_at)
+            refs_per_search.append(json.loads(row[0]) if row else None)
+
+        # One batched places lookup assembles every hit
+        place_ids = sorted({ref[0] for refs in refs_per_search if refs for ref in refs})
+        places_by_id = self._load_places(place_ids)
+        return [assemble_results(refs, places_by_id) if refs is not None else None for refs in refs_per_search]
+
+    def _load_places(self, place_ids):
+        conn = self._connection()
+        places_by_id = {}
+        for chunk in _chunks(place_ids, self.SQL_VARIABLE_CHUNK):
+            rows = conn.execute(
+                f"SELECT place_id, data FROM places WHERE place_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            places_by_id.update({place_id: json.loads(data) for place_id, data in rows})
+        return places_by_id
+
+    def _upsert_places(self, conn, places_by_id):
+        """Writes only the places whose content hash changed. Returns the number written."""
+        place_ids = list(places_by_id)
+        existing = {}
+        for chunk in _chunks(place_ids, self.SQL_VARIABLE_CHUNK):
+            existing.update(conn.execute(
+                f"SELECT place_id, content_hash FROM places WHERE place_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+
+        now = time.time()
+        changed = []
+        for place_id, place in places_by_id.items():
+            content_hash = place_content_hash(place)
+            if existing.get(place_id) != content_hash:
+                changed.append((place_id, json.dumps(place, separators=(',', ':')), content_hash, now))
+        conn.executemany(
+            "INSERT INTO places (place_id, data, content_hash, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (place_id) DO UPDATE SET data = excluded.data, content_hash = excluded.content_hash, "
+            "updated_at = excluded.updated_at",
+            changed
+        )
+        return len(changed)
+
+    def entry_age_days(self, lat, lon, search_type, city_name=None):
+        row = self._find(lat, lon, search_type, city_name, 0)
+        return (time.time() - row[1]) / 86400 if row else None
+
+    def _find(self, lat, lon, search_type, city_name, min_created_at):
+        """Returns the (place_refs, created_at) row that answers a search, or None."""
+        conn = self._connection()
+        # Negative entries are stored as '[]' and only count while younger than their own TTL
+        min_negative_created_at = max(min_created_at, time.time() - NEGATIVE_CACHE_TTL_HOURS * 3600)
+
+        if city_name:
+            city_key = normalize_city_key(city_name)
+            # Exact key first, then an indexed prefix range ('london' matches 'london united kingdom')
+            row = conn.execute(
+                "SELECT place_refs, created_at FROM search_live WHERE search_type = ? AND city_key = ? AND created_at >= ? "
+                "AND (place_refs != '[]' OR created_at >= ?) ORDER BY created_at DESC LIMIT 1",
+                (search_type, city_key, min_created_at, min_negative_created_at)
+            ).fetchone() or conn.execute(
+                "SELECT place_refs, created_at FROM search_live WHERE search_type = ? AND city_key >= ? AND city_key < ? AND created_at >= ? "
+                "AND (place_refs != '[]' OR created_at >= ?) ORDER BY created_at DESC LIMIT 1",
+                (search_type, city_key, city_key + '\uffff', min_created_at, min_negative_created_at)
+            ).fetchone()
+            if row:
+                return row
+
+        # Bounding box of the search radius, then the exact distance check on the few candidates
+        dlat = PROXIMITY_RADIUS_METERS / 111320.0
+        dlon = PROXIMITY_RADIUS_METERS / (111320.0 * max(math.cos(math.radians(lat)), 0.01))
+        candidates = conn.execute(
+            # CROSS JOIN pins the R*Tree as the outer loop; otherwise SQLite may scan by search_type
+            "SELECT s.latitude, s.longitude, s.place_refs, s.created_at FROM search_live_rtree r CROSS JOIN search_live s ON s.id = r.id "
+            "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ? "
+            "AND s.search_type = ? AND s.created_at >= ? AND (s.place_refs != '[]' OR s.created_at >= ?) ORDER BY s.created_at DESC",
+            (lat - dlat, lat + dlat, lon - dlon, lon + dlon, search_type, min_created_at, min_negative_created_at)
+        ).fetchall()
+        best = None
+        for c_lat, c_lon, place_refs, created_at in candidates:
+            distance_m = calculate_distance(lat, lon, c_lat, c_lon) * 1000
+            if distance_m <= PROXIMITY_RADIUS_METERS and (best is None or distance_m < best[0]):
+                best = (distance_m, (place_refs, created_at))
+        return best[1] if best else None
+
+    def save(self, lat, lon, search_type, results, city_name=None):
+        places_by_id, place_refs = split_results(results)
+        conn = self._connection()
+        with conn:
+            changed_count = self._upsert_places(conn, places_by_id)
+            cursor = conn.execute(
+                "INSERT INTO search_live (latitude, longitude, search_type, city_name, city_key, place_refs, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (lat, lon, search_type, city_name.lower() if city_name else None,
+                 normalize_city_key(city_name) if city_name else None,
+                 json.dumps(place_refs, separators=(',', ':')), time.time())
+            )
+            conn.execute(
+                "INSERT INTO search_live_rtree (id, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+                (cursor.lastrowid, lat, lat, lon, lon)
+            )
+        print(f"Successfully saved search (lat: {lat}, lon: {lon}, city: {city_name}) to SQLite "
+              f"({changed_count}/{len(places_by_id)} places written).")
+
+
+def create_cache_store(backend, supabase=None, sqlite_path=None):
+    """Builds the cache backend selected by CACHE_BACKEND ('supabase' or 'sqlite')."""
+    if backend == 'sqlite':
+        path = sqlite_path or os.getenv('SQLITE_CACHE_PATH', 'cache.sqlite3')
+        print(f"Using SQLite cache backend at '{path}'.")
+        return SQLiteCacheStore(path)
+    if backend == 'supabase':
+        return SupabaseCacheStore(supabase)
+    raise ValueError(f"Unknown CACHE_BACKEND '{backend}'. Use 'supabase' or 'sqlite'.")
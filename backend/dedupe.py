@@ -0,0 +1,171 @@
+# dedupe.py
+#
+# Fuzzy de-duplication of places. Google sometimes lists one venue twice, under two
+# place_ids with slightly different names at the same address, and exact place_id
+# de-duplication keeps both.
+#
+# Comparing every pair would be O(n^2), so places are blocked first: each one is indexed
+# under (geocell, name token) for every significant token of its normalized name. Geocells
+# are a plain lat/lon grid at least DEDUPE_MAX_DISTANCE_METERS wide (cheaper than geohashes),
+# so fuzzy scoring only runs between places that share a token in the same or one of the 8
+# neighbouring cells. That keeps it fast enough to run inline on lists of thousands of places.
+#
+# Off by default: set DEDUPE_ENABLED=1 to merge duplicates in search results.
+
+import os
+import re
+import time
+import math
+import unicodedata
+from find_places import calculate_distance
+
+# --- CONFIGURATION ---
+DEDUPE_ENABLED = os.getenv('DEDUPE_ENABLED', '0') == '1'
+DEDUPE_MAX_DISTANCE_METERS = float(os.getenv('DEDUPE_MAX_DISTANCE_METERS', 75))
+DEDUPE_NAME_THRESHOLD = int(os.getenv('DEDUPE_NAME_THRESHOLD', 88))
+# Same-address pairs need a lower name score ("Joe's" vs "Joe's Pizzeria & Bar")
+DEDUPE_SAME_ADDRESS_THRESHOLD = int(os.getenv('DEDUPE_SAME_ADDRESS_THRESHOLD', 75))
+# Tokens shared by more places than this in one cell are too common to block on
+DEDUPE_MAX_BUCKET = 50
+# --- END CONFIGURATION ---
+
+_STOPWORDS = {'the', 'and', 'a', 'an', 'of', 'at', 'on', 'in', 'le', 'la', 'el', 'il', 'de', 'du', 'des',
+              'restaurant', 'restaurants', 'cafe', 'bar', 'bakery', 'ltd', 'co', 'inc'}
+_NON_WORD = re.compile(r"[^\w\s]")
+
+_scorer = None
+
+
+def _get_scorer():
+    """fuzzywuzzy's token_set_ratio, imported on first use so disabled dedupe costs nothing at startup."""
+    global _scorer
+    if _scorer is None:
+        from fuzzywuzzy import fuzz
+        _scorer = fuzz.token_set_ratio
+    return _scorer
+
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(_NON_WORD.sub(' ', text.replace("'", '')).split())
+
+
+def name_tokens(name):
+    """Significant tokens of a normalized name, used as blocking keys."""
+    tokens = [t for t in normalize_text(name).split() if t not in _STOPWORDS and len(t) > 1]
+    return tokens or normalize_text(name).split()
+
+
+def _location(place):
+    location = (place.get('geometry') or {}).get('location') or {}
+    if location.get('lat') is None or location.get('lng') is None:
+        return None
+    return location['lat'], location['lng']
+
+
+def _grid(entries):
+    """Cell size in degrees (lat, lon) so that a cell is at least DEDUPE_MAX_DISTANCE_METERS wide everywhere in the list."""
+    lat_step = DEDUPE_MAX_DISTANCE_METERS / 111320
+    max_abs_lat = max((abs(e['location'][0]) for e in entries if e['location']), default=0.0)
+    return lat_step, lat_step / max(math.cos(math.radians(min(max_abs_lat, 89.0))), 0.01)
+
+
+def _is_duplicate(a, b, score):
+    """Decides a candidate pair using the name score, distance and address."""
+    if a['location'] and b['location']:
+        lat1, lon1 = a['location']
+        lat2, lon2 = b['location']
+        if calculate_distance(lat1, lon1, lat2, lon2) * 1000 > DEDUPE_MAX_DISTANCE_METERS:
+            return False
+    same_address = bool(a['address']) and a['address'] == b['address']
+    if same_address:
+        return score >= DEDUPE_SAME_ADDRESS_THRESHOLD
+    # Without coordinates, a matching address is the only evidence we accept
+    return bool(a['location'] and b['location']) and score >= DEDUPE_NAME_THRESHOLD
+
+
+def dedupe_places(places):
+    """
+    Collapses near-duplicate places. Of each group of duplicates, the place with the most
+    ratings is kept, at the position of the group's first member.
+    Returns (deduplicated places, stats).
+    """
+    started = time.perf_counter()
+    scorer = _get_scorer()
+
+    # Exact place_id duplicates first
+    entries, seen_ids = [], set()
+    for place in places:
+        place_id = place.get('place_id')
+        if place_id in seen_ids:
+            continue
+        seen_ids.add(place_id)
+        location = _location(place)
+        entries.append({
+            'place': place,
+            'name': normalize_text(place.get('name')),
+            'tokens': set(name_tokens(place.get('name'))),
+            'address': normalize_text(place.get('address')),
+            'location': location,
+        })
+
+    lat_step, lon_step = _grid(entries)
+    for entry in entries:
+        location = entry['location']
+        entry['cell'] = (math.floor(location[0] / lat_step), math.floor(location[1] / lon_step)) if location else None
+
+    # Block: (cell, token) -> entry indexes. Places without coordinates block on their address
+    buckets = {}
+    for i, entry in enumerate(entries):
+        block = entry['cell'] or f"addr:{entry['address']}"
+        for token in entry['tokens']:
+            buckets.setdefault((block, token), []).append(i)
+
+    parent = list(range(len(entries)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    compared, comparisons = set(), 0
+    for i, entry in enumerate(entries):
+        if entry['cell']:
+            row, col = entry['cell']
+            blocks = [(row + dr, col + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)]
+        else:
+            blocks = [f"addr:{entry['address']}"]
+        for block in blocks:
+            for token in entry['tokens']:
+                candidates = buckets.get((block, token), ())
+                if len(candidates) > DEDUPE_MAX_BUCKET:
+                    continue
+                for j in candidates:
+                    if j <= i or (i, j) in compared:
+                        continue
+                    compared.add((i, j))
+                    if find(i) == find(j):
+                        continue
+                    comparisons += 1
+                    if _is_duplicate(entry, entries[j], scorer(entry['name'], entries[j]['name'])):
+                        parent[find(j)] = find(i)
+
+    groups = {}
+    for i in range(len(entries)):
+        groups.setdefault(find(i), []).append(i)
+    kept = []
+    for members in sorted(groups.values(), key=lambda m: m[0]):
+        best = max(members, key=lambda i: (entries[i]['place'].get('user_ratings_total') or 0, -i))
+        kept.append(entries[best]['place'])
+
+    stats = {
+        'input': len(places),
+        'output': len(kept),
+        'merged': len(places) - len(kept),
+        'exact_id_duplicates': len(places) - len(entries),
+        'buckets': len(buckets),
+        'comparisons': comparisons,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+    return kept, stats
@@ -0,0 +1,60 @@
+# export_tiles.py
+#
+# Build step: exports the cached searches in Supabase's `search_live` table that are still
+# within CACHE_TTL_DAYS into static geohash tiles that app.py can serve from memory-mapped files (set TILE_DIR to enable).
+#
+#   python export_tiles.py [tile_dir]
+#
+# Safe to run against a live TILE_DIR: the export is written to a new `<tile_dir>.<timestamp>`
+# directory and `tile_dir` becomes a symlink flipped to it once it is complete.
+
+import os
+import sys
+import dotenv
+from datetime import datetime, timedelta, timezone
+from supabase import create_client
+from tiles import write_tiles, new_export_dir, publish_tiles
+from cache_store import SupabaseCacheStore, CACHE_TTL_DAYS
+
+dotenv.load_dotenv()
+
+PAGE_SIZE = 1000
+DEFAULT_OUTPUT_DIR = os.getenv('TILE_DIR', 'static_tiles')
+
+
+def fetch_all_searches(supabase):
+    """Yields unexpired `search_live` rows, newest first, with results assembled from `places` one page at a time."""
+    store = SupabaseCacheStore(supabase)
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=CACHE_TTL_DAYS)).isoformat()
+    start = 0
+    while True:
+        response = supabase.table('search_live') \
+            .select('latitude, longitude, search_type, city_name, results, place_refs, created_at') \
+            .gte('created_at', cutoff) \
+            .order('created_at', desc=True) \
+            .range(start, start + PAGE_SIZE - 1) \
+            .execute()
+        if not response.data:
+            break
+        yield from store.resolve_results(response.data)
+        if len(response.data) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+
+
+def export_tiles(tile_dir):
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")
+    if not supabase_url or not supabase_key:
+        raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in the .env file.")
+
+    supabase = create_client(supabase_url, supabase_key)
+    export_dir = new_export_dir(tile_dir)
+    print(f"Exporting cached searches to '{export_dir}'...")
+    tile_count, search_count = write_tiles(fetch_all_searches(supabase), export_dir)
+    publish_tiles(export_dir, tile_dir)
+    print(f"Done. Wrote {search_count} searches into {tile_count} tiles; '{tile_dir}' now points at '{export_dir}'.")
+
+
+if __name__ == "__main__":
+    export_tiles(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_OUTPUT_DIR)
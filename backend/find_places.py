@@ -4,10 +4,14 @@ import os
 import time 
 import math
 from dotenv import load_dotenv
-import re
+from resilience import get_breaker, hedged_get, timeout_for, UpstreamUnavailable
+from gemini_stream import gemini_stream_url, stream_categorization
 
 load_dotenv()
 
+# Follow-up requests for place_ids missing from a truncated or malformed Gemini response
+GEMINI_MISSING_RETRIES = int(os.getenv('GEMINI_MISSING_RETRIES', 1))
+
 # --- Helper Functions ---
 
 def calculate_distance(lat1, lon1, lat2, lon2):
@@ -20,33 +24,96 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
+
+DEDICATED_GF_KEYWORDS = ("gluten-free", "gluten free", "glutenfrei", "sans gluten", "senza glutine", "sin gluten", "celiac", "coeliac")
+FOOD_TYPES = {"restaurant", "cafe", "bakery", "bar", "food", "meal_takeaway", "meal_delivery"}
+
+
+def classify_places_locally(places_list):
+    """Degraded-mode categorization used when Gemini is unavailable. Mirrors the prompt's rules."""
+    categorization = {}
+    for place in places_list:
+        name = (place.get("name") or "").lower()
+        if any(keyword in name for keyword in DEDICATED_GF_KEYWORDS):
+            status = "Dedicated GF"
+        elif FOOD_TYPES.intersection(place.get("types", [])):
+            status = "Offers GF"
+        else:
+            status = "Status Unclear"
+        categorization[place.get("place_id")] = status
+    return categorization
+
+# --- Multi-Type Helpers ---
+
+# Google `types` that place a result under each of the app's filters
+GOOGLE_TYPES_BY_FILTER = {
+    "restaurants": {"restaurant", "meal_takeaway", "meal_delivery"},
+    "cafes": {"cafe"},
+    "bakery": {"bakery"},
+}
+MULTI_TYPE_KEYWORD = "gluten-free food"
+
+
+def split_places_by_type(places_list, types):
+    """Splits one broad result set into {filter: [places]} by Google `types`. A place can land in several lists."""
+    places_by_type = {}
+    for type_ in types:
+        google_types = GOOGLE_TYPES_BY_FILTER.get(type_, {type_})
+        # Copies, so each list can be enriched and cached independently
+        places_by_type[type_] = [dict(p) for p in places_list if google_types.intersection(p.get("types", []))]
+    return places_by_type
+
 # --- Google Places API Function ---
 
-def find_gluten_free_restaurants_places_api(api_key, type_, city_name=None, country_filter=None, lat=None, lon=None):
+def find_gluten_free_restaurants_places_api(api_key, type_, city_name=None, country_filter=None, lat=None, lon=None, deadline=None, types=None):
+    """
+    Returns a list of operational places for `type_`. In multi-type mode (`types` given) it makes one
+    broader query instead and returns {type: [places]} for each requested type.
+    """
     if not api_key:
-        print("Google Places API key is missing.")
-        return []
+        # Not "no results": an empty answer here would be cached as a negative entry
+        raise UpstreamUnavailable("Google Places API key is missing.")
 
     all_places = []
     params = {'key': api_key}
+    keyword = MULTI_TYPE_KEYWORD if types else f"gluten-free {type_}"
     
     # Logic to choose between Text Search and Nearby Search
     if lat is not None and lon is not None:
         url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-        params.update({'location': f"{lat},{lon}", 'radius': 5000, 'keyword': f"gluten-free {type_}", 'type': type_})
+        params.update({'location': f"{lat},{lon}", 'radius': 5000, 'keyword': keyword})
+        if not types:
+            params['type'] = type_
     elif city_name:
         query_location_part = f"{city_name}, {country_filter.strip()}" if country_filter and country_filter.strip() else city_name
         url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-        params.update({'query': f"gluten-free {type_} in {query_location_part}"})
+        params.update({'query': f"{keyword} in {query_location_part}"})
     else:
-        return []
+        return {t: [] for t in types} if types else []
 
-    max_pages = 2
+    breaker = get_breaker('places')
+    # The broad query is shared by several types, so take Google's full 3 pages (60 results)
+    max_pages = 3 if types else 2
+    pages_fetched = 0
     for _ in range(max_pages):
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            timeout = timeout_for(deadline, 10)
+            breaker.check()
+            # Anything that goes wrong after check() must be recorded, or a half-open breaker stays stuck
+            try:
+                response = hedged_get(url, params=params, timeout=timeout)
+                response.raise_for_status()
+                data = response.json()
+                # Only ZERO_RESULTS is a real empty answer; OVER_QUERY_LIMIT, REQUEST_DENIED etc. are outages
+                status = data.get("status")
+                if status not in ("OK", "ZERO_RESULTS"):
+                    raise UpstreamUnavailable(f"Google Places API returned {status}: {data.get('error_message', '')}")
+            except Exception:
+                breaker.record_failure()
+                raise
+            else:
+                breaker.record_success()
+            pages_fetched += 1
             
             if data.get("status") == "OK":
                 for result in data.get("results", []):
@@ -66,25 +133,33 @@ def find_gluten_free_restaurants_places_api(api_key, type_, city_name=None, coun
                         all_places.append(place_details)
             
             next_page_token = data.get('next_page_token')
-            if next_page_token:
+            # The page token takes ~2s to become valid; skip the next page if the budget can't cover it
+            if next_page_token and (deadline is None or deadline.remaining() > 2 + 1):
                 params = {'pagetoken': next_page_token, 'key': api_key}
                 time.sleep(2)
             else:
                 break
         except requests.exceptions.RequestException as e:
             print(f"Error calling Google Places API: {e}")
+            if not pages_fetched:
+                raise UpstreamUnavailable("Google Places API request failed.") from e
+            break
+        except UpstreamUnavailable as e:
+            # Breaker open, budget exhausted or an error status: keep the earlier pages if we have them
+            print(f"Google Places API unavailable: {e}")
+            if not pages_fetched:
+                raise
             break
 
-    unique_places = {place['place_id']: place for place in all_places}.values()
-    return list(unique_places)
+    unique_places = list({place['place_id']: place for place in all_places}.values())
+    if types:
+        return split_places_by_type(unique_places, types)
+    return unique_places
 
 
 # --- NEW: Gemini Categorization Function ---
 
-def categorize_places_with_gemini(api_key, places_list, type_, city_name=None):
-    if not api_key or not places_list:
-        return {}
-
+def build_categorization_prompt(places_list, type_, city_name=None):
     location_context = f"in {city_name}" if city_name else "near the user's location"
     
     # Create a simplified list for the prompt
@@ -124,33 +199,50 @@ def categorize_places_with_gemini(api_key, places_list, type_, city_name=None):
       ]
     }}
     """
-    
-    gemini_api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={api_key}"
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
-    headers = {"Content-Type": "application/json"}
-
-    try:
-        response = requests.post(gemini_api_url, headers=headers, json=payload, timeout=60)
-        response.raise_for_status()
-        
-        raw_text = response.json()["candidates"][0]["content"]["parts"][0]["text"]
-        
-        # Clean the response to extract only the JSON part
-        json_match = re.search(r'```json\s*([\s\S]*?)\s*```', raw_text)
-        if json_match:
-            json_str = json_match.group(1)
-        else:
-            json_str = raw_text
-
-        data = json.loads(json_str)
-        
-        # Convert the list of objects into a more efficient dictionary for lookup
-        categorization_dict = {
-            item["place_id"]: item["gf_status"] 
-            for item in data.get("categorization", [])
-        }
-        return categorization_dict
-
-    except Exception as e:
-        print(f"Error processing Gemini response: {e}")
+    return prompt
+
+
+def categorize_places_with_gemini(api_key, places_list, type_, city_name=None, deadline=None, on_entry=None):
+    """
+    Categorizes places through Gemini's streaming endpoint. Entries are parsed as they arrive
+    and passed to `on_entry(place_id, gf_status)`; place_ids missing from the output (truncated
+    or malformed entries) are asked for again, up to GEMINI_MISSING_RETRIES times.
+    Returns {place_id: gf_status}, which may be partial, or {} if Gemini is unavailable.
+    """
+    if not api_key or not places_list:
         return {}
+
+    wanted = {p['place_id'] for p in places_list}
+    categorization = {}
+
+    def accept(place_id, gf_status):
+        if place_id in wanted and place_id not in categorization:
+            categorization[place_id] = gf_status
+            if on_entry:
+                on_entry(place_id, gf_status)
+
+    breaker = get_breaker('gemini')
+    pending = places_list
+    for _ in range(1 + GEMINI_MISSING_RETRIES):
+        payload = {"contents": [{"parts": [{"text": build_categorization_prompt(pending, type_, city_name)}]}]}
+        try:
+            timeout = timeout_for(deadline, 60)
+            breaker.check()
+            # Any exception after check() counts as a failure, or a half-open breaker stays stuck
+            try:
+                stream_categorization(gemini_stream_url(api_key), payload, timeout, on_entry=accept, deadline=deadline)
+            except Exception:
+                breaker.record_failure()
+                raise
+            else:
+                breaker.record_success()
+        except Exception as e:
+            print(f"Error processing Gemini response: {e}")
+            break
+
+        pending = [p for p in places_list if p['place_id'] not in categorization]
+        if not pending:
+            break
+        print(f"Gemini categorized {len(categorization)}/{len(wanted)} places; {len(pending)} missing.")
+
+    return categorization
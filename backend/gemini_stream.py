@@ -0,0 +1,152 @@
+# gemini_stream.py
+#
+# Streaming categorization calls to Gemini. The response is read from the
+# streamGenerateContent SSE endpoint and parsed incrementally, so every complete
+# {"place_id": ..., "gf_status": ...} entry is recovered as soon as it arrives, even if the
+# output is later cut off or one entry is malformed. Set GEMINI_API_BASE to point at a
+# local stub (see gemini_stub.py).
+
+import os
+import re
+import json
+import requests
+from resilience import DeadlineExceeded
+
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com')
+GEMINI_MODEL = 'gemini-1.5-flash-latest'
+GF_STATUSES = ("Dedicated GF", "Offers GF", "Status Unclear")
+# Where every entry starts; the scanner resyncs here whatever state a broken entry left it in
+_ENTRY_START = re.compile(r'\{\s*"place_id"')
+_ENTRY_START_TEXT = '"place_id"'
+
+
+def gemini_stream_url(api_key):
+    return f"{GEMINI_API_BASE}/v1beta/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse&key={api_key}"
+
+
+class CategorizationStreamParser:
+    """
+    Incremental scanner for categorization entries. Feed it text chunks; it tracks strings and
+    brace nesting across chunks and returns every JSON object that closes with a `place_id`
+    and a valid `gf_status`. Markdown fences and the wrapping object are simply skipped.
+
+    A cut-off or unbalanced entry must not throw off the rest of the stream, so the scanner
+    resyncs at every `{"place_id"` and closes any open string at a raw newline (never valid
+    inside a JSON string).
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._starts = []  # offsets of the currently open '{'
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        self._buffer += text
+        entries = []
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '{':
+                if _ENTRY_START.match(buffer, pos):
+                    self._in_string, self._escaped = False, False
+                    self._starts = [pos]
+                    pos += 1
+                    continue
+                if self._could_be_entry_start(buffer, pos):
+                    break  # wait for the rest of it before deciding
+            if char == '\n':
+                self._in_string, self._escaped = False, False
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._starts.append(pos)
+            elif char == '}' and self._starts:
+                start = self._starts.pop()
+                # Only innermost objects can be entries; the wrapping object is never parsed
+                if buffer.find('{', start + 1, pos) == -1:
+                    entry = self._parse_entry(buffer[start:pos + 1])
+                    if entry:
+                        entries.append(entry)
+            pos += 1
+        self._pos = pos
+        self._compact()
+        return entries
+
+    @staticmethod
+    def _could_be_entry_start(buffer, pos):
+        """True if the text from this '{' to the end of the buffer is a prefix of an entry start."""
+        tail = buffer[pos + 1:pos + 65]
+        if pos + 65 < len(buffer):
+            return False  # enough text to decide, and it didn't match
+        rest = tail.lstrip()
+        return len(rest) < len(_ENTRY_START_TEXT) and _ENTRY_START_TEXT.startswith(rest)
+
+    @staticmethod
+    def _parse_entry(text):
+        try:
+            item = json.loads(text)
+        except ValueError:
+            return None  # a malformed entry costs only itself
+        if not isinstance(item, dict) or item.get('gf_status') not in GF_STATUSES or not isinstance(item.get('place_id'), str):
+            return None
+        return item['place_id'], item['gf_status']
+
+    def _compact(self):
+        # Text before the outermost open object is never needed again
+        keep_from = min(self._starts[0], self._pos) if self._starts else self._pos
+        if keep_from > 4096:
+            self._buffer = self._buffer[keep_from:]
+            self._pos -= keep_from
+            self._starts = [s - keep_from for s in self._starts]
+
+
+def stream_categorization(url, payload, timeout, on_entry=None, deadline=None):
+    """
+    POSTs `payload` to the SSE endpoint and returns {place_id: gf_status} for every entry
+    parsed. `on_entry(place_id, gf_status)` is called as each entry arrives. If the stream
+    breaks after some entries were parsed, those are returned instead of raising.
+
+    With stream=True, `timeout` only bounds each read, so a slow but steady stream is cut off
+    once `deadline` runs out, keeping the entries parsed so far.
+    """
+    parser = CategorizationStreamParser()
+    results = {}
+    response = requests.post(url, json=payload, timeout=timeout, stream=True)
+    try:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if deadline is not None and deadline.expired():
+                if not results:
+                    raise DeadlineExceeded("Request budget ran out while streaming from Gemini.")
+                print(f"Request budget ran out; keeping {len(results)} streamed Gemini entries.")
+                break
+            if not line or not line.startswith('data:'):
+                continue
+            try:
+                event = json.loads(line[len('data:'):])
+            except ValueError:
+                continue  # a garbled event loses only its own text
+            for candidate in event.get('candidates', [])[:1]:
+                for part in candidate.get('content', {}).get('parts', []):
+                    for place_id, gf_status in parser.feed(part.get('text', '')):
+                        if place_id not in results:
+                            results[place_id] = gf_status
+                            if on_entry:
+                                on_entry(place_id, gf_status)
+    except requests.exceptions.RequestException as e:
+        if not results:
+            raise
+        print(f"Gemini stream interrupted after {len(results)} entries: {e}")
+    finally:
+        response.close()
+    return results
@@ -0,0 +1,95 @@
+# gemini_stub.py
+#
+# A local stand-in for Gemini's streamGenerateContent SSE endpoint, for exercising the
+# streaming categorization parser without an API key. It categorizes the places in the
+# prompt with the local rules and streams the JSON answer in small chunks. It can also
+# misbehave on purpose:
+#
+#   python gemini_stub.py [--port 8089] [--chunk-size 40] [--delay-ms 20]
+#                         [--truncate-after N] [--malformed-every N]
+#                         [--malformed-style colon|quote|cut]
+#
+# --truncate-after N   cuts the stream off in the middle of entry N+1
+# --malformed-every N  corrupts every Nth entry so it is not valid JSON:
+#                      'colon' drops a colon, 'quote' leaves a string unclosed and
+#                      'cut' ends the entry halfway, then the output carries on
+#
+# Then point the app at it: GEMINI_API_BASE=http://127.0.0.1:8089
+
+import json
+import time
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from find_places import classify_places_locally
+
+
+def places_from_prompt(prompt):
+    listing = prompt.split('JSON format:', 1)[1].split('**Analysis Criteria', 1)[0]
+    return json.loads(listing)
+
+
+def malform(entry, style='colon'):
+    if style == 'quote':
+        return entry.replace('", ', ', ', 1)
+    if style == 'cut':
+        return entry[:len(entry) // 2]
+    return entry.replace('": ', '" ', 1)
+
+
+def categorization_text(places, truncate_after=0, malformed_every=0, malformed_style='colon'):
+    entries = []
+    for i, (place_id, status) in enumerate(classify_places_locally(places).items(), start=1):
+        entry = json.dumps({"place_id": place_id, "gf_status": status})
+        if malformed_every and i % malformed_every == 0:
+            entry = malform(entry, malformed_style)
+        entries.append(entry)
+    text = '```json\n{"categorization": [\n  ' + ',\n  '.join(entries) + '\n]}\n```'
+    if truncate_after and truncate_after < len(entries):
+        text = text[:text.index(entries[truncate_after]) + len(entries[truncate_after]) // 2]
+    return text
+
+
+def make_handler(options):
+    class GeminiStubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if ':streamGenerateContent' not in self.path:
+                self.send_error(404, "Only streamGenerateContent is stubbed.")
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            text = categorization_text(places_from_prompt(body['contents'][0]['parts'][0]['text']),
+                                       options.truncate_after, options.malformed_every, options.malformed_style)
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            for i in range(0, len(text), options.chunk_size):
+                event = {"candidates": [{"content": {"parts": [{"text": text[i:i + options.chunk_size]}], "role": "model"}}]}
+                self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(options.delay_ms / 1000)
+
+        def log_message(self, format, *args):
+            print(f"Gemini stub: {format % args}")
+
+    return GeminiStubHandler
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Local Gemini streaming stub.")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--chunk-size', type=int, default=40)
+    parser.add_argument('--delay-ms', type=float, default=20)
+    parser.add_argument('--truncate-after', type=int, default=0)
+    parser.add_argument('--malformed-every', type=int, default=0)
+    parser.add_argument('--malformed-style', choices=('colon', 'quote', 'cut'), default='colon')
+    return parser
+
+
+def serve(options):
+    server = ThreadingHTTPServer(('127.0.0.1', options.port), make_handler(options))
+    print(f"Gemini stub listening on http://127.0.0.1:{server.server_port}")
+    return server
+
+
+if __name__ == "__main__":
+    serve(build_parser().parse_args()).serve_forever()
@@ -0,0 +1,19 @@
+# metrics.py
+#
+# In-process counters, exposed through the /admin/metrics route.
+
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot():
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,171 @@
+# prewarm.py
+#
+# Traffic-driven cache warming. Every /get-restaurants request is recorded in a decaying
+# heatmap of (geohash cell, type). A background thread periodically re-fetches the hottest
+# cells whose cache entries are about to expire, within an hourly upstream budget.
+#
+# Under gunicorn every worker starts a scheduler, but only one per host refreshes: the one
+# holding an flock on PREWARM_LOCK_PATH. The others retry the lock each interval and take
+# over if the leader's process exits. PREWARM_MAX_REFRESHES_PER_HOUR is therefore a per-host
+# budget. The leader ranks cells from the traffic its own worker sees, which is a sample of
+# the host's traffic.
+
+import os
+import math
+import time
+import fcntl
+import tempfile
+import threading
+import traceback
+from tiles import geohash_encode
+
+# --- CONFIGURATION ---
+PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', '0') == '1'
+PREWARM_INTERVAL_SECONDS = float(os.getenv('PREWARM_INTERVAL_SECONDS', 300))
+PREWARM_HALF_LIFE_HOURS = float(os.getenv('PREWARM_HALF_LIFE_HOURS', 6))
+# Each refresh costs one Places search (plus page 2) and one Gemini call
+PREWARM_MAX_REFRESHES_PER_HOUR = int(os.getenv('PREWARM_MAX_REFRESHES_PER_HOUR', 30))
+# Refresh entries this many days before they expire
+PREWARM_LEAD_DAYS = float(os.getenv('PREWARM_LEAD_DAYS', 2))
+PREWARM_MAX_CELLS = int(os.getenv('PREWARM_MAX_CELLS', 5000))
+PREWARM_CELL_PRECISION = 6  # ~1.2km x 0.6km, close to the 500m proximity cache radius
+# Don't retry a cell whose refresh produced nothing cacheable for this long
+PREWARM_RETRY_AFTER_SECONDS = 24 * 3600
+# One scheduler per host refreshes: whichever worker holds this lock
+PREWARM_LOCK_PATH = os.getenv('PREWARM_LOCK_PATH') or os.path.join(tempfile.gettempdir(), 'gf_finder_prewarm.lock')
+# --- END CONFIGURATION ---
+
+
+class SearchHeatmap:
+    """Exponentially decaying request counts per (cell, type), bounded to `max_cells` entries."""
+
+    def __init__(self, half_life_hours=PREWARM_HALF_LIFE_HOURS, max_cells=PREWARM_MAX_CELLS):
+        self.decay_rate = math.log(2) / (half_life_hours * 3600)
+        self.max_cells = max_cells
+        # (cell, search_type) -> {'score', 'updated_at', 'lat', 'lon', 'city'}
+        self.cells = {}
+        self._lock = threading.Lock()
+
+    def _decayed(self, entry, now):
+        return entry['score'] * math.exp(-self.decay_rate * (now - entry['updated_at']))
+
+    def record(self, lat, lon, search_type, city_name=None):
+        now = time.time()
+        key = (geohash_encode(lat, lon, PREWARM_CELL_PRECISION), search_type)
+        with self._lock:
+            entry = self.cells.get(key)
+            score = self._decayed(entry, now) + 1 if entry else 1.0
+            # The latest request's coordinates represent the cell when it is re-fetched
+            self.cells[key] = {'score': score, 'updated_at': now, 'lat': lat, 'lon': lon,
+                               'city': city_name or (entry and entry['city'])}
+            if len(self.cells) > self.max_cells:
+                self._prune(now)
+
+    def _prune(self, now):
+        """Drops the coldest quarter of cells. Caller holds the lock."""
+        ranked = sorted(self.cells, key=lambda k: self._decayed(self.cells[k], now))
+        for key in ranked[:len(ranked) // 4]:
+            del self.cells[key]
+
+    def hottest(self, limit):
+        """Returns up to `limit` cells as (score, (cell, search_type), entry), hottest first."""
+        now = time.time()
+        with self._lock:
+            ranked = [(self._decayed(entry, now), key, dict(entry)) for key, entry in self.cells.items()]
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return ranked[:limit]
+
+
+class PrewarmScheduler:
+    """
+    Background thread that keeps hot cells warm. `refresh(lat, lon, search_type, city)` runs the
+    upstream fetch and saves the result; `cache_store.entry_age_days` tells us what is about to expire.
+    """
+
+    def __init__(self, heatmap, cache_store, refresh, ttl_days,
+                 interval_seconds=PREWARM_INTERVAL_SECONDS,
+                 max_refreshes_per_hour=PREWARM_MAX_REFRESHES_PER_HOUR,
+                 lead_days=PREWARM_LEAD_DAYS,
+                 lock_path=PREWARM_LOCK_PATH):
+        self.heatmap = heatmap
+        self.cache_store = cache_store
+        self.refresh = refresh
+        self.refresh_after_days = max(0.0, ttl_days - lead_days)
+        self.interval_seconds = interval_seconds
+        self.max_refreshes_per_hour = max_refreshes_per_hour
+        self._refresh_times = []
+        self._last_attempt = {}
+        self.lock_path = lock_path
+        self._lock_fd = None
+        self._is_leader = lock_path is None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='prewarm', daemon=True)
+            self._thread.start()
+            print(f"Pre-warm scheduler started (every {self.interval_seconds}s, "
+                  f"max {self.max_refreshes_per_hour} refreshes/hour).")
+
+    def stop(self):
+        self._stop.set()
+
+    def _remaining_budget(self):
+        hour_ago = time.time() - 3600
+        self._refresh_times = [t for t in self._refresh_times if t > hour_ago]
+        return self.max_refreshes_per_hour - len(self._refresh_times)
+
+    def _try_lead(self):
+        """Takes the host-wide lock if it is free. The lock is held until this process exits."""
+        if self._is_leader:
+            return True
+        if self._lock_fd is None:
+            self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self._is_leader = True
+        print(f"Pre-warm scheduler in process {os.getpid()} is now the leader for this host.")
+        return True
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                if self._try_lead():
+                    self.run_once()
+            except Exception as e:
+                print(f"Error in pre-warm scheduler: {e}")
+                traceback.print_exc()
+
+    def run_once(self):
+        """Refreshes the hottest cells that are missing or close to expiry. Returns the number refreshed."""
+        budget = self._remaining_budget()
+        if budget <= 0:
+            return 0
+
+        refreshed = 0
+        now = time.time()
+        self._last_attempt = {k: t for k, t in self._last_attempt.items() if now - t < PREWARM_RETRY_AFTER_SECONDS}
+        # Look a bit beyond the budget: most hot cells are usually still fresh
+        for score, key, cell in self.heatmap.hottest(budget * 4):
+            if refreshed >= budget:
+                break
+            search_type = key[1]
+            if now - self._last_attempt.get(key, 0) < PREWARM_RETRY_AFTER_SECONDS:
+                continue
+            age_days = self.cache_store.entry_age_days(cell['lat'], cell['lon'], search_type, cell['city'])
+            if age_days is not None and age_days < self.refresh_after_days:
+                continue
+
+            print(f"PRE-WARM: refreshing {search_type} at ({cell['lat']}, {cell['lon']}) "
+                  f"city={cell['city']} score={score:.1f} age_days={age_days}")
+            self._refresh_times.append(now)
+            self._last_attempt[key] = now
+            refreshed += 1
+            try:
+                self.refresh(cell['lat'], cell['lon'], search_type, cell['city'])
+            except Exception as e:
+                print(f"PRE-WARM: refresh failed: {e}")
+        return refreshed
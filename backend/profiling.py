@@ -0,0 +1,160 @@
+# profiling.py
+#
+# Opt-in production profiling. 1 in PROFILE_SAMPLE_EVERY requests to the profiled paths
+# (or any request carrying an `X-Profile: 1` header) is profiled, and the last
+# PROFILE_MAX_PROFILES profiles are kept in memory for the /admin/profiles routes.
+#
+#   PROFILE_MODE=stacks  (default) a sampler thread records the request thread's stack every
+#                        PROFILE_INTERVAL_MS; output is collapsed stacks for flamegraph tools.
+#   PROFILE_MODE=pstats  deterministic cProfile; output is a pstats report.
+
+import os
+import sys
+import io
+import time
+import itertools
+import threading
+import cProfile
+import pstats
+from collections import Counter, deque
+from flask import g, request, jsonify, Response
+
+# --- CONFIGURATION ---
+PROFILE_SAMPLE_EVERY = int(os.getenv('PROFILE_SAMPLE_EVERY', 0))  # 0 = only header-triggered
+PROFILE_MAX_PROFILES = int(os.getenv('PROFILE_MAX_PROFILES', 20))
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'stacks')
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+PROFILE_PATHS = tuple(os.getenv('PROFILE_PATHS', '/get-restaurants').split(','))
+# The admin routes and the X-Profile header are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# --- END CONFIGURATION ---
+
+
+def is_admin_request():
+    """True when the current request carries the configured admin token."""
+    return bool(ADMIN_TOKEN) and request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer and counts identical stacks."""
+
+    def __init__(self, thread_id, interval_seconds):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
+
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps the most recent profiles in a bounded buffer."""
+
+    def __init__(self, sample_every=PROFILE_SAMPLE_EVERY, max_profiles=PROFILE_MAX_PROFILES,
+                 mode=PROFILE_MODE, interval_ms=PROFILE_INTERVAL_MS, paths=PROFILE_PATHS):
+        self.sample_every = sample_every
+        self.mode = mode
+        self.interval_seconds = interval_ms / 1000
+        self.paths = paths
+        self.profiles = deque(maxlen=max_profiles)
+        self._counter = itertools.count(1)
+        self._ids = itertools.count(1)
+        # cProfile can only have one active profiler per process on newer Pythons
+        self._cprofile_lock = threading.Lock()
+
+    def should_profile(self):
+        if request.headers.get('X-Profile') == '1' and is_admin_request():
+            return True
+        if self.sample_every > 0 and request.path.startswith(self.paths):
+            return next(self._counter) % self.sample_every == 0
+        return False
+
+    def start(self):
+        if self.mode == 'pstats':
+            if not self._cprofile_lock.acquire(blocking=False):
+                return None
+            profile = cProfile.Profile()
+            profile.enable()
+            return profile
+        sampler = StackSampler(threading.get_ident(), self.interval_seconds)
+        sampler.start()
+        return sampler
+
+    def finish(self, handle, started_at, status_code):
+        if isinstance(handle, cProfile.Profile):
+            handle.disable()
+            self._cprofile_lock.release()
+            stream = io.StringIO()
+            pstats.Stats(handle, stream=stream).sort_stats('cumulative').print_stats(60)
+            output = stream.getvalue()
+        else:
+            stacks = handle.stop()
+            output = '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+        self.profiles.append({
+            'id': next(self._ids),
+            'path': request.full_path,
+            'method': request.method,
+            'status': status_code,
+            'duration_ms': round((time.perf_counter() - started_at) * 1000, 1),
+            'mode': self.mode,
+            'recorded_at': time.time(),
+            'output': output,
+        })
+
+
+def register_profiling(app, profiler=None):
+    """Installs the request hooks and the /admin/profiles routes on a Flask app."""
+    profiler = profiler or RequestProfiler()
+
+    @app.before_request
+    def _start_profile():
+        if profiler.should_profile():
+            g.profile_started_at = time.perf_counter()
+            g.profile_handle = profiler.start()
+
+    @app.teardown_request
+    def _finish_profile(exc):
+        handle = g.pop('profile_handle', None)
+        if handle is not None:
+            profiler.finish(handle, g.pop('profile_started_at'), 500 if exc else g.get('profile_status'))
+
+    @app.after_request
+    def _remember_status(response):
+        g.profile_status = response.status_code
+        return response
+
+    @app.route('/admin/profiles', methods=['GET'])
+    def list_profiles_route():
+        if not is_admin_request():
+            return jsonify({"error": "Not found."}), 404
+        return jsonify({"profiles": [{k: v for k, v in p.items() if k != 'output'} for p in profiler.profiles]})
+
+    @app.route('/admin/profiles/<int:profile_id>', methods=['GET'])
+    def get_profile_route(profile_id):
+        if not is_admin_request():
+            return jsonify({"error": "Not found."}), 404
+        profile = next((p for p in profiler.profiles if p['id'] == profile_id), None)
+        if profile is None:
+            return jsonify({"error": f"Profile {profile_id} not found."}), 404
+        return Response(profile['output'], mimetype='text/plain')
+
+    return profiler
@@ -0,0 +1,101 @@
+# replay_driver.py
+#
+# Repeatable throughput runs: drives the app in-process with the populate_database.py city
+# list (city coordinates, then one multi-type /get-restaurants call per city) from several
+# concurrent clients, and reports throughput and latency percentiles.
+#
+#   python replay_driver.py --record            # real APIs, builds UPSTREAM_CORPUS
+#   python replay_driver.py [--workers 8] [--cities 20] [--rounds 2]
+#
+# Without --record, upstream calls are replayed from the corpus with their recorded
+# latencies (UPSTREAM_MODE=replay), so nothing calls Google, Gemini or Supabase. Unless
+# CACHE_BACKEND is set, each run starts from an empty SQLite cache; --rounds > 1 repeats
+# the city list to measure warm-cache throughput too.
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from populate_database import CITIES_TO_PREPOPULATE, FILTERS
+
+
+def configure_environment(record):
+    os.environ['UPSTREAM_MODE'] = 'record' if record else 'replay'
+    os.environ.setdefault('PREWARM_ENABLED', '0')
+    if 'CACHE_BACKEND' not in os.environ:
+        os.environ['CACHE_BACKEND'] = 'sqlite'
+        os.environ['SQLITE_CACHE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='replay_'), 'cache.sqlite3')
+    if not record:
+        # Keys are redacted in the corpus, so any value works in replay mode
+        os.environ.setdefault('GEMINI_API_KEY', 'replay')
+        os.environ.setdefault('GOOGLE_PLACES_API_KEY', 'replay')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(workers, cities, rounds, record):
+    configure_environment(record)
+    import app as app_module
+    corpus = app_module.install_upstream_mode('record' if record else 'replay', os.getenv('UPSTREAM_CORPUS', 'upstream_corpus.jsonl.gz'))
+    flask_app = app_module.create_app()
+    timings, statuses = {}, Counter()
+    lock = threading.Lock()
+
+    def timed_get(endpoint, params):
+        started = time.perf_counter()
+        response = flask_app.test_client().get(endpoint, query_string=params)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            timings.setdefault(endpoint, []).append(elapsed_ms)
+            statuses[f"{endpoint} {response.status_code}"] += 1
+        return response
+
+    def run_city(city):
+        coords = timed_get('/find-city-coordinates', {'city': city})
+        if coords.status_code != 200:
+            return
+        coords = coords.get_json()
+        timed_get('/get-restaurants', {'lat': coords['lat'], 'lon': coords['lng'], 'types': ','.join(FILTERS), 'city': city})
+
+    city_list = CITIES_TO_PREPOPULATE[:cities] if cities else CITIES_TO_PREPOPULATE
+    for round_number in range(1, rounds + 1):
+        timings.clear()
+        statuses.clear()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run_city, city_list))
+        elapsed = time.perf_counter() - started
+
+        total = sum(len(v) for v in timings.values())
+        print(f"\nRound {round_number}: {len(city_list)} cities, {total} requests in {elapsed:.1f}s "
+              f"({total / elapsed:.1f} req/s, {workers} workers)")
+        for endpoint, values in sorted(timings.items()):
+            print(f"  {endpoint:<24} p50 {statistics.median(values):8.1f}ms   p95 {percentile(values, 95):8.1f}ms   "
+                  f"p99 {percentile(values, 99):8.1f}ms   max {max(values):8.1f}ms")
+        print(f"  statuses: {dict(statuses)}")
+
+    if record:
+        corpus.close()
+        print(f"\nRecorded {corpus.count} upstream calls to '{corpus.path}'.")
+    else:
+        print(f"\nReplay matches: {corpus.stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded upstream traffic against the app.")
+    parser.add_argument('--record', action='store_true', help="call the real APIs and record the corpus")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--cities', type=int, default=0, help="limit to the first N cities (default: all)")
+    parser.add_argument('--rounds', type=int, default=1)
+    args = parser.parse_args()
+    run(args.workers, args.cities, args.rounds, args.record)
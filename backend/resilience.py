@@ -0,0 +1,163 @@
+# resilience.py
+
+import os
+import time
+import threading
+import queue
+import requests
+
+# --- CONFIGURATION ---
+REQUEST_BUDGET_SECONDS = float(os.getenv('REQUEST_BUDGET_SECONDS', 25))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', 30))
+# Hedging is off unless a delay is configured, e.g. PLACES_HEDGE_AFTER_SECONDS=1.5
+PLACES_HEDGE_AFTER_SECONDS = float(os.getenv('PLACES_HEDGE_AFTER_SECONDS', 0))
+# --- END CONFIGURATION ---
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream API cannot be used to answer the current request."""
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """Raised when the request's latency budget has run out."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """Raised when a circuit breaker is rejecting calls to its upstream."""
+
+
+class Deadline:
+    """A per-request latency budget that is passed down to every upstream call."""
+
+    def __init__(self, budget_seconds=REQUEST_BUDGET_SECONDS):
+        self.budget_seconds = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap):
+        """Returns the timeout for the next call: the remaining budget, capped at `cap` seconds."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request budget of {self.budget_seconds}s exhausted.")
+        return min(remaining, cap)
+
+
+def timeout_for(deadline, cap):
+    """Helper so callers without a deadline keep their old fixed timeouts."""
+    return deadline.timeout(cap) if deadline else cap
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker. After `failure_threshold` consecutive
+    failures the breaker opens and rejects calls for `reset_seconds`; then a single
+    trial call is let through and its outcome decides whether to close again.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                # Let exactly one trial request through
+                self.state = 'half_open'
+                return True
+            return False
+
+    def check(self):
+        """Raises CircuitOpenError instead of returning False, for use before an upstream call."""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is open.")
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"Circuit breaker '{self.name}' OPENED after {self.failures} failures.")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures}
+
+
+# One breaker per upstream. Both Places endpoints live behind the same Google API.
+BREAKERS = {
+    'places': CircuitBreaker('places'),
+    'gemini': CircuitBreaker('gemini'),
+}
+
+
+def get_breaker(name):
+    return BREAKERS[name]
+
+
+# --- HEDGED REQUESTS ---
+
+def _start_get(outcomes, url, params, timeout):
+    """Runs a GET on its own thread and puts (response, None) or (None, error) on `outcomes`."""
+    def run():
+        try:
+            outcomes.put((requests.get(url, params=params, timeout=timeout), None))
+        except Exception as e:
+            outcomes.put((None, e))
+    # A thread per call, not a shared pool: time spent queueing would count as upstream latency
+    threading.Thread(target=run, name='hedge', daemon=True).start()
+
+
+def hedged_get(url, params, timeout, hedge_after=PLACES_HEDGE_AFTER_SECONDS):
+    """
+    Performs a GET and, if it has not completed after `hedge_after` seconds, fires a
+    duplicate request and returns whichever succeeds first. Only use for idempotent calls.
+    `timeout` bounds the whole call (requests' own timeout is per read); past it
+    DeadlineExceeded is raised and the stragglers are left to finish in the background.
+    """
+    if not hedge_after or hedge_after >= timeout:
+        return requests.get(url, params=params, timeout=timeout)
+
+    expires_at = time.monotonic() + timeout
+    outcomes = queue.Queue()
+    _start_get(outcomes, url, params, timeout)
+    in_flight = 1
+    try:
+        response, error = outcomes.get(timeout=hedge_after)
+    except queue.Empty:
+        _start_get(outcomes, url, params, max(0.1, timeout - hedge_after))
+        in_flight = 2
+    else:
+        if error is not None:
+            raise error
+        return response
+
+    last_error = None
+    for _ in range(in_flight):
+        try:
+            response, error = outcomes.get(timeout=max(0.0, expires_at - time.monotonic()))
+        except queue.Empty:
+            raise DeadlineExceeded(f"Hedged GET to {url} took longer than {timeout:.1f}s.")
+        if error is None:
+            return response
+        last_error = error
+    raise last_error
@@ -0,0 +1,133 @@
+# shared_cache.py
+#
+# A response cache shared by every gunicorn worker on a host. It is a fixed-size,
+# memory-mapped file (in /dev/shm when available) holding serialized /get-restaurants
+# responses, so a result fetched by one worker is immediately a hit for the others.
+#
+# Layout: a small header followed by `num_slots` fixed-size slots. A key hashes to two
+# candidate slots. Each slot is guarded by a sequence counter (a seqlock):
+#   - writers take an fcntl byte-range lock on just that slot, bump the counter to odd,
+#     write, then bump it back to even;
+#   - readers take no lock: they read the counter, the slot, and the counter again, and
+#     retry if it changed or was odd.
+# Total memory is bounded by num_slots * slot_size; entries that don't fit are skipped.
+
+import os
+import time
+import mmap
+import zlib
+import fcntl
+import struct
+import hashlib
+import tempfile
+import threading
+
+# --- CONFIGURATION ---
+SHARED_CACHE_ENABLED = os.getenv('SHARED_CACHE_ENABLED', '0') == '1'
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH') or os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'gf_finder_shared_cache')
+SHARED_CACHE_SLOTS = int(os.getenv('SHARED_CACHE_SLOTS', 1024))
+SHARED_CACHE_SLOT_BYTES = int(os.getenv('SHARED_CACHE_SLOT_BYTES', 32768))
+SHARED_CACHE_TTL_SECONDS = float(os.getenv('SHARED_CACHE_TTL_SECONDS', 3600))
+# --- END CONFIGURATION ---
+
+_MAGIC = b'GFSC0001'
+_FILE_HEADER = struct.Struct('<8sII')       # magic, num_slots, slot_size
+_SLOT_HEADER = struct.Struct('<QQdHxxI')    # seq, key hash, expires_at, status, payload length
+_SEQ = struct.Struct('<Q')
+_MAX_READ_RETRIES = 4
+
+
+def _key_hash(key):
+    # 0 marks an empty slot, so never hand it out as a real hash
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+
+class SharedResponseCache:
+    """Cross-process cache of (status_code, response body bytes), keyed by string."""
+
+    def __init__(self, path=SHARED_CACHE_PATH, num_slots=SHARED_CACHE_SLOTS, slot_size=SHARED_CACHE_SLOT_BYTES):
+        self.path = path
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.max_payload = slot_size - _SLOT_HEADER.size
+        self._header_size = mmap.PAGESIZE
+        size = self._header_size + num_slots * slot_size
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # The first worker to get here sizes and stamps the file; the rest reuse it
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, _FILE_HEADER.size, 0)
+            if os.fstat(self._fd).st_size != size or header != _FILE_HEADER.pack(_MAGIC, num_slots, slot_size):
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, _FILE_HEADER.pack(_MAGIC, num_slots, slot_size), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+        # fcntl locks are per process, so threads of one worker also need an in-process lock
+        self._write_lock = threading.Lock()
+
+    def _offset(self, slot):
+        return self._header_size + slot * self.slot_size
+
+    def _candidate_slots(self, key_hash):
+        first = key_hash % self.num_slots
+        return first, (first + 1) % self.num_slots
+
+    def get(self, key):
+        """Returns (status_code, body) or None. Never blocks on writers."""
+        key_hash = _key_hash(key)
+        now = time.time()
+        for slot in self._candidate_slots(key_hash):
+            offset = self._offset(slot)
+            for _ in range(_MAX_READ_RETRIES):
+                seq, slot_hash, expires_at, status, length = _SLOT_HEADER.unpack_from(self._map, offset)
+                if seq % 2:
+                    continue  # write in progress
+                if slot_hash != key_hash or expires_at < now or length > self.max_payload:
+                    break
+                payload = self._map[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + length]
+                if _SEQ.unpack_from(self._map, offset)[0] != seq:
+                    continue  # torn read, try again
+                return status, zlib.decompress(payload)
+        return None
+
+    def put(self, key, status, body, ttl_seconds=SHARED_CACHE_TTL_SECONDS):
+        """Stores a response. Returns False if it doesn't fit in a slot."""
+        payload = zlib.compress(body, 1)
+        if len(payload) > self.max_payload:
+            return False
+        key_hash = _key_hash(key)
+        now = time.time()
+
+        # Prefer the slot already holding this key, then an empty/expired one, then the soonest to expire
+        candidates = []
+        for slot in self._candidate_slots(key_hash):
+            _, slot_hash, expires_at, _, _ = _SLOT_HEADER.unpack_from(self._map, self._offset(slot))
+            rank = 0 if slot_hash == key_hash else 1 if slot_hash == 0 or expires_at < now else 2
+            candidates.append((rank, expires_at, slot))
+        slot = min(candidates)[2]
+        offset = self._offset(slot)
+
+        with self._write_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot_size, offset)
+            try:
+                seq = _SEQ.unpack_from(self._map, offset)[0]
+                _SEQ.pack_into(self._map, offset, seq + 1)
+                _SLOT_HEADER.pack_into(self._map, offset, seq + 1, key_hash, now + ttl_seconds, status, len(payload))
+                self._map[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + len(payload)] = payload
+                _SEQ.pack_into(self._map, offset, seq + 2)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot_size, offset)
+        return True
+
+
+def load_shared_cache():
+    """Returns the SharedResponseCache when SHARED_CACHE_ENABLED=1, else None."""
+    if not SHARED_CACHE_ENABLED:
+        return None
+    cache = SharedResponseCache()
+    print(f"Shared response cache ON: {cache.num_slots} x {cache.slot_size // 1024}KB slots at '{cache.path}'.")
+    return cache
@@ -0,0 +1,43 @@
+-- Normalized cache storage (see cache_store.py).
+-- Places are stored once, keyed by Google place_id; searches reference them in order.
+
+CREATE TABLE IF NOT EXISTS places (
+    place_id TEXT PRIMARY KEY,
+    data JSONB NOT NULL,
+    content_hash TEXT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- [[place_id, distance_km], ...] in response order. Rows written before this change keep `results`.
+ALTER TABLE search_live ADD COLUMN IF NOT EXISTS place_refs JSONB;
+ALTER TABLE search_live ALTER COLUMN results DROP NOT NULL;
+
+-- Proximity lookup used by SupabaseCacheStore. It returns whole search_live rows (results,
+-- place_refs and created_at), newest first: callers serve the first usable row and read the
+-- entry's age from the first one. Age limits are applied by the caller, so the same function
+-- also serves stale fallbacks.
+DROP FUNCTION IF EXISTS find_nearby_searches;
+CREATE OR REPLACE FUNCTION find_nearby_searches(
+    request_lat DOUBLE PRECISION,
+    request_lon DOUBLE PRECISION,
+    request_type TEXT,
+    radius_meters DOUBLE PRECISION
+)
+RETURNS SETOF search_live
+LANGUAGE sql STABLE
+AS $$
+    SELECT s.*
+    FROM search_live s
+    WHERE s.search_type = request_type
+      -- Latitude band first so the index below narrows the scan
+      AND s.latitude BETWEEN request_lat - radius_meters / 111320.0 AND request_lat + radius_meters / 111320.0
+      AND 2 * 6371000 * asin(sqrt(
+              power(sin(radians(s.latitude - request_lat) / 2), 2)
+              + cos(radians(request_lat)) * cos(radians(s.latitude))
+              * power(sin(radians(s.longitude - request_lon) / 2), 2)
+          )) <= radius_meters
+    ORDER BY s.created_at DESC
+    LIMIT 10;
+$$;
+
+CREATE INDEX IF NOT EXISTS search_live_type_latitude_idx ON search_live (search_type, latitude);
@@ -0,0 +1,150 @@
+# Streaming categorization against gemini_stub.py running in-process: truncated and malformed
+# output, follow-up requests for missing place_ids, and the request deadline.
+#
+#   cd backend && python -m pytest tests
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gemini_stub
+import gemini_stream
+import find_places
+from resilience import Deadline, CircuitBreaker, BREAKERS
+from find_places import categorize_places_with_gemini, classify_places_locally
+from gemini_stream import CategorizationStreamParser, stream_categorization
+
+
+def make_places(count):
+    return [{"place_id": f"place-{i}", "name": f"Gluten Free Kitchen {i}" if i % 4 == 0 else f"Bistro {i}",
+             "types": ["restaurant"]} for i in range(count)]
+
+
+class CategorizationStreamParserTest(unittest.TestCase):
+
+    def test_entries_split_across_chunks(self):
+        text = '```json\n{"categorization": [{"place_id": "a", "gf_status": "Offers GF"}, {"place_id": "b}", "gf_status": "Dedicated GF"}]}\n```'
+        parser = CategorizationStreamParser()
+        entries = []
+        for i in range(0, len(text), 7):
+            entries.extend(parser.feed(text[i:i + 7]))
+        self.assertEqual(entries, [("a", "Offers GF"), ("b}", "Dedicated GF")])
+
+    def test_malformed_and_invalid_entries_are_skipped(self):
+        parser = CategorizationStreamParser()
+        entries = parser.feed('{"categorization": [{"place_id" "a", "gf_status": "Offers GF"}, '
+                              '{"place_id": "b", "gf_status": "Maybe"}, {"place_id": "c", "gf_status": "Status Unclear"}]}')
+        self.assertEqual(entries, [("c", "Status Unclear")])
+
+    def test_unbalanced_quote_mid_stream(self):
+        parser = CategorizationStreamParser()
+        entries = parser.feed('{"categorization": [{"place_id": "a, "gf_status": "Offers GF"}, '
+                              '{"place_id": "b", "gf_status": "Offers GF"}, {"place_id": "c", "gf_status": "Dedicated GF"}]}')
+        self.assertEqual(entries, [("b", "Offers GF"), ("c", "Dedicated GF")])
+
+    def test_entry_cut_off_mid_stream(self):
+        text = ('{"categorization": [{"place_id": "a", "gf_sta{"place_id": "b", "gf_status": "Offers GF"},\n'
+                '  {"place_id": "c", "gf_status": "Dedicated GF"}]}')
+        for size in (1, 5, len(text)):
+            parser = CategorizationStreamParser()
+            entries = []
+            for i in range(0, len(text), size):
+                entries.extend(parser.feed(text[i:i + size]))
+            self.assertEqual(entries, [("b", "Offers GF"), ("c", "Dedicated GF")])
+
+    def test_buffer_is_compacted(self):
+        parser = CategorizationStreamParser()
+        text = '{"categorization": [' + ', '.join(
+            f'{{"place_id": "p{i}", "gf_status": "Offers GF"}}' for i in range(2000)) + ']}'
+        count, largest = 0, 0
+        for i in range(0, len(text), 64):
+            count += len(parser.feed(text[i:i + 64]))
+            largest = max(largest, len(parser._buffer))
+        self.assertEqual(count, 2000)
+        self.assertLess(largest, 8192)
+
+
+class GeminiStubTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.options = gemini_stub.build_parser().parse_args(['--port', '0', '--delay-ms', '0'])
+        cls.server = gemini_stub.serve(cls.options)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_patch = mock.patch.object(gemini_stream, 'GEMINI_API_BASE', f"http://127.0.0.1:{cls.server.server_port}")
+        cls.base_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.base_patch.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        defaults = gemini_stub.build_parser().parse_args(['--port', '0', '--delay-ms', '0'])
+        for name, value in vars(defaults).items():
+            setattr(self.options, name, value)
+        BREAKERS['gemini'] = CircuitBreaker('gemini')
+
+    def stream(self, places, **kwargs):
+        payload = {"contents": [{"parts": [{"text": find_places.build_categorization_prompt(places, 'restaurants')}]}]}
+        return stream_categorization(gemini_stream.gemini_stream_url('test-key'), payload, 10, **kwargs)
+
+    def test_complete_stream(self):
+        places = make_places(12)
+        streamed = []
+        results = self.stream(places, on_entry=lambda place_id, gf_status: streamed.append(place_id))
+        self.assertEqual(results, classify_places_locally(places))
+        self.assertEqual(streamed, [p["place_id"] for p in places])
+
+    def test_truncated_stream_keeps_complete_entries(self):
+        self.options.truncate_after = 5
+        places = make_places(12)
+        results = self.stream(places)
+        self.assertEqual(list(results), [p["place_id"] for p in places[:5]])
+
+    def test_malformed_entries_cost_only_themselves(self):
+        self.options.malformed_every = 3
+        places = make_places(12)
+        results = self.stream(places)
+        self.assertEqual(set(results), {p["place_id"] for i, p in enumerate(places, start=1) if i % 3})
+
+    def test_broken_entries_dont_lose_the_rest_of_the_stream(self):
+        places = make_places(12)
+        for style in ('quote', 'cut'):
+            self.options.malformed_every, self.options.malformed_style = 3, style
+            results = self.stream(places)
+            self.assertEqual(set(results), {p["place_id"] for i, p in enumerate(places, start=1) if i % 3}, style)
+
+    def test_missing_place_ids_are_requested_again(self):
+        self.options.truncate_after = 8
+        places = make_places(12)
+        with mock.patch.object(find_places, 'GEMINI_MISSING_RETRIES', 1):
+            categorization = categorize_places_with_gemini('test-key', places, 'restaurants')
+        # The follow-up asks only for the 4 missing places, which fit before the truncation point
+        self.assertEqual(categorization, classify_places_locally(places))
+
+    def test_retries_are_bounded(self):
+        self.options.malformed_every = 2
+        places = make_places(8)
+        with mock.patch.object(find_places, 'GEMINI_MISSING_RETRIES', 1):
+            categorization = categorize_places_with_gemini('test-key', places, 'restaurants')
+        # 4 of 8 on the first call, then 2 of the 4 missing ones on the single retry
+        self.assertEqual(len(categorization), 6)
+
+    def test_deadline_stops_a_slow_stream_with_partial_results(self):
+        self.options.chunk_size = 20
+        self.options.delay_ms = 50
+        places = make_places(40)
+        results = self.stream(places, deadline=Deadline(0.5))
+        self.assertTrue(0 < len(results) < len(places))
+        self.assertTrue(all(results[place_id] == status for place_id, status in classify_places_locally(places).items()
+                            if place_id in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
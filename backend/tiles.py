@@ -0,0 +1,279 @@
+# tiles.py
+#
+# Static, read-only tiles of cached search results. `export_tiles.py` writes one
+# JSON-lines file per geohash tile plus an index; `TileStore` serves them through mmap
+# so pre-populated cities are answered without touching the database.
+#
+# Tile files are never rewritten in place: truncating a file that a worker has mapped
+# kills it with SIGBUS on the next read. Each export goes into a new versioned directory
+# and TILE_DIR is a symlink that is flipped to it atomically. Workers notice the flip and
+# remap; the previous export is kept so workers still on it can finish their reads.
+
+import os
+import re
+import json
+import time
+import mmap
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from find_places import calculate_distance
+
+TILE_PRECISION = 5  # ~4.9km x 4.9km cells
+INDEX_FILENAME = 'index.json'
+# Mapped tiles kept open per worker; each one holds a file descriptor
+TILE_MAX_OPEN_MAPS = int(os.getenv('TILE_MAX_OPEN_MAPS', 256))
+# How often a worker checks whether TILE_DIR points at a new export
+TILE_RELOAD_CHECK_SECONDS = float(os.getenv('TILE_RELOAD_CHECK_SECONDS', 30))
+# Exports kept on disk, including the live one
+TILE_KEEP_EXPORTS = 2
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+# --- Geohash Helpers ---
+
+def geohash_encode(lat, lon, precision=TILE_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(geohash)
+
+
+def geohash_cell_size(precision=TILE_PRECISION):
+    """Returns the (lat, lon) size in degrees of a geohash cell at this precision."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = (5 * precision) // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def geohash_with_neighbours(lat, lon, precision=TILE_PRECISION):
+    """The cell containing the point plus its 8 neighbours, so radius lookups near an edge still match."""
+    dlat, dlon = geohash_cell_size(precision)
+    cells = []
+    for i in (0, -1, 1):
+        for j in (0, -1, 1):
+            n_lat = max(-90.0, min(90.0, lat + i * dlat))
+            n_lon = ((lon + j * dlon + 180.0) % 360.0) - 180.0
+            cell = geohash_encode(n_lat, n_lon, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+# --- Tile Reader ---
+
+def _timestamp(created_at):
+    """Epoch seconds for a Supabase ISO-8601 `created_at`, or None."""
+    if not created_at:
+        return None
+    created = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return created.timestamp()
+
+
+class _TileExport:
+    """One export's index and its mapped tiles, bounded to TILE_MAX_OPEN_MAPS (least recently used go first)."""
+
+    def __init__(self, export_dir):
+        self.export_dir = export_dir
+        index_path = os.path.join(export_dir, INDEX_FILENAME)
+        self.index_stat = os.stat(index_path)
+        with open(index_path) as f:
+            index = json.load(f)
+        self.precision = index['precision']
+        # tile -> [[lat, lon, search_type, city_name, offset, length, created_at], ...]
+        self.tiles = index['tiles']
+        # "search_type|city_name" -> [tile, offset, length, created_at]
+        self.cities = index['cities']
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def map_for(self, tile):
+        with self._lock:
+            mapped = self._maps.get(tile)
+            if mapped is not None:
+                self._maps.move_to_end(tile)
+                return mapped
+            with open(os.path.join(self.export_dir, f"{tile}.jsonl"), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[tile] = mapped
+            if len(self._maps) > TILE_MAX_OPEN_MAPS:
+                # Not closed explicitly: a reader may still hold it, and it unmaps once the last reference goes
+                self._maps.popitem(last=False)
+            return mapped
+
+    def read(self, tile, offset, length):
+        return json.loads(self.map_for(tile)[offset:offset + length])['results']
+
+
+class TileStore:
+    """
+    Answers cache lookups from exported tiles. All reads are mmap slices; no database queries.
+    Entries older than `max_age_days` are ignored, so lookups fall back to the live path.
+    A new export published to `tile_dir` is picked up within TILE_RELOAD_CHECK_SECONDS.
+    """
+
+    def __init__(self, tile_dir, max_age_days=None):
+        self.tile_dir = tile_dir
+        self.max_age_days = max_age_days
+        self._export = _TileExport(os.path.realpath(tile_dir))
+        self._checked_at = time.monotonic()
+        self._reload_lock = threading.Lock()
+
+    @property
+    def tiles(self):
+        return self._export.tiles
+
+    def _current(self):
+        """The export to serve from, switching to a newly published one if TILE_DIR has moved."""
+        export = self._export
+        if time.monotonic() - self._checked_at < TILE_RELOAD_CHECK_SECONDS or not self._reload_lock.acquire(blocking=False):
+            return export
+        try:
+            self._checked_at = time.monotonic()
+            export_dir = os.path.realpath(self.tile_dir)
+            index_stat = os.stat(os.path.join(export_dir, INDEX_FILENAME))
+            if export_dir != export.export_dir or (index_stat.st_ino, index_stat.st_mtime_ns) != \
+                    (export.index_stat.st_ino, export.index_stat.st_mtime_ns):
+                export = self._export = _TileExport(export_dir)
+                print(f"Tile export reloaded: {len(export.tiles)} tiles from '{export_dir}'.")
+        except OSError as e:
+            print(f"Error checking for a new tile export, keeping the current one. Error: {e}")
+        finally:
+            self._reload_lock.release()
+        return export
+
+    def _is_fresh(self, entry, created_at_index):
+        # Exports made before created_at was stored have no age to check
+        created_at = entry[created_at_index] if len(entry) > created_at_index else None
+        if self.max_age_days is None or created_at is None:
+            return True
+        return time.time() - created_at <= self.max_age_days * 86400
+
+    def lookup_city(self, city_name, search_type, export=None):
+        """Mirrors the live `ilike '%city%'` match: exact key first, then substring."""
+        export = export or self._current()
+        city_key = city_name.lower()
+        entry = export.cities.get(f"{search_type}|{city_key}")
+        if entry is None or not self._is_fresh(entry, 3):
+            prefix = f"{search_type}|"
+            entry = next((v for k, v in export.cities.items()
+                          if k.startswith(prefix) and city_key in k[len(prefix):] and self._is_fresh(v, 3)), None)
+        return export.read(*entry[:3]) if entry else None
+
+    def lookup_nearby(self, lat, lon, search_type, radius_meters=500, export=None):
+        export = export or self._current()
+        best = None
+        for tile in geohash_with_neighbours(lat, lon, export.precision):
+            for entry in export.tiles.get(tile, ()):
+                e_lat, e_lon, e_type, _, offset, length = entry[:6]
+                if e_type != search_type or not self._is_fresh(entry, 6):
+                    continue
+                distance_m = calculate_distance(lat, lon, e_lat, e_lon) * 1000
+                if distance_m <= radius_meters and (best is None or distance_m < best[0]):
+                    best = (distance_m, tile, offset, length)
+        return export.read(*best[1:]) if best else None
+
+    def lookup(self, lat, lon, search_type, city_name=None):
+        # One export for the whole lookup, even if a reload happens meanwhile
+        export = self._current()
+        if city_name:
+            results = self.lookup_city(city_name, search_type, export)
+            if results is not None:
+                return results
+        return self.lookup_nearby(lat, lon, search_type, export=export)
+
+
+def load_tile_store(tile_dir, max_age_days=None):
+    """Returns a TileStore if `tile_dir` holds an export, else None (serving mode off)."""
+    if not tile_dir or not os.path.exists(os.path.join(tile_dir, INDEX_FILENAME)):
+        return None
+    store = TileStore(tile_dir, max_age_days)
+    print(f"Tile serving mode ON: {len(store.tiles)} tiles loaded from '{tile_dir}'.")
+    return store
+
+
+# --- Tile Writer ---
+
+def write_tiles(rows, out_dir, precision=TILE_PRECISION):
+    """
+    Writes `search_live`-shaped rows (latitude, longitude, search_type, city_name, results,
+    created_at) into per-tile JSON-lines files and an index. Newer rows should come first; only the first
+    row per (tile, lat, lon, type) and per (type, city) is kept. Negative (empty) entries are
+    skipped: they expire quickly, so those searches stay on the live path.
+
+    `out_dir` must be a fresh directory, not one being served (see publish_tiles).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    # Grouped first so only one tile file is open at a time, however many cells the searches cover
+    lines_by_tile, cities, seen = {}, {}, set()
+    for row in rows:
+        if not row.get('results'):
+            continue
+        lat, lon, search_type = row['latitude'], row['longitude'], row['search_type']
+        city_name = (row.get('city_name') or '').lower()
+        tile = geohash_encode(lat, lon, precision)
+        key = (tile, round(lat, 5), round(lon, 5), search_type)
+        if key in seen:
+            continue
+        seen.add(key)
+        line = json.dumps({'results': row['results']}, separators=(',', ':')).encode('utf-8')
+        lines_by_tile.setdefault(tile, []).append((lat, lon, search_type, city_name, line, _timestamp(row.get('created_at'))))
+
+    tiles = {}
+    for tile, lines in lines_by_tile.items():
+        offset = 0
+        with open(os.path.join(out_dir, f"{tile}.jsonl"), 'wb') as f:
+            for lat, lon, search_type, city_name, line, created_at in lines:
+                f.write(line + b'\n')
+                tiles.setdefault(tile, []).append([lat, lon, search_type, city_name, offset, len(line), created_at])
+                if city_name:
+                    cities.setdefault(f"{search_type}|{city_name}", [tile, offset, len(line), created_at])
+                offset += len(line) + 1
+
+    with open(os.path.join(out_dir, INDEX_FILENAME), 'w') as f:
+        json.dump({'precision': precision, 'tiles': tiles, 'cities': cities}, f, separators=(',', ':'))
+    return len(tiles), len(seen)
+
+
+def new_export_dir(tile_dir):
+    """A fresh versioned directory next to `tile_dir` for the next export."""
+    return f"{tile_dir.rstrip(os.sep)}.{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}"
+
+
+def publish_tiles(export_dir, tile_dir):
+    """
+    Points the `tile_dir` symlink at `export_dir` with an atomic rename, then deletes exports
+    beyond the newest TILE_KEEP_EXPORTS. A plain directory left at `tile_dir` by an older
+    export is moved aside first.
+    """
+    tile_dir = tile_dir.rstrip(os.sep)
+    if os.path.isdir(tile_dir) and not os.path.islink(tile_dir):
+        os.rename(tile_dir, new_export_dir(tile_dir))
+    temp_link = f"{tile_dir}.link-{os.getpid()}"
+    os.symlink(os.path.basename(export_dir), temp_link)
+    os.replace(temp_link, tile_dir)
+
+    # Deleting is safe for workers that still have old tiles mapped; only truncation isn't
+    parent, name = os.path.split(os.path.abspath(tile_dir))
+    version = re.compile(re.escape(name) + r'\.\d{20}$')
+    exports = sorted((d for d in os.listdir(parent) if version.match(d)), reverse=True)
+    live = os.path.basename(os.path.realpath(tile_dir))
+    for old in exports[TILE_KEEP_EXPORTS:]:
+        if old != live:
+            shutil.rmtree(os.path.join(parent, old), ignore_errors=True)
@@ -0,0 +1,246 @@
+# upstream_replay.py
+#
+# Record/replay of upstream HTTP calls, for repeatable load tests without Google or Gemini.
+#
+#   UPSTREAM_MODE=record  every call made through `requests` (Places, findplacefromtext,
+#                         Gemini) and `httpx` (Supabase) is appended to UPSTREAM_CORPUS with
+#                         its status, body and latency. API keys are redacted.
+#   UPSTREAM_MODE=replay  the same calls are answered from the corpus after sleeping the
+#                         recorded latency (times REPLAY_LATENCY_SCALE); nothing leaves the host.
+#
+# The corpus is gzipped JSON lines, one interaction per line. Calls are matched on method,
+# redacted URL and a hash of the redacted request body. When there's no exact match (e.g. a
+# Supabase insert carrying a new timestamp) the recordings for the same method and URL are
+# used instead; calls with no recording at all fail like a connection error. Timestamps in
+# query values (e.g. Supabase's created_at=gte.<now - TTL> freshness filter) are replaced with
+# a placeholder, so those lookups match across runs.
+#
+# Recorded latency covers the whole call including the body, and a replayed response arrives
+# in one piece after that delay: streamed Gemini output is not re-chunked on replay.
+
+import os
+import json
+import gzip
+import time
+import re
+import hashlib
+import itertools
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+
+# --- CONFIGURATION ---
+UPSTREAM_MODE = os.getenv('UPSTREAM_MODE', 'off')  # off | record | replay
+UPSTREAM_CORPUS = os.getenv('UPSTREAM_CORPUS', 'upstream_corpus.jsonl.gz')
+REPLAY_LATENCY_SCALE = float(os.getenv('REPLAY_LATENCY_SCALE', 1.0))
+# --- END CONFIGURATION ---
+
+REDACTED = 'REDACTED'
+VOLATILE = 'VOLATILE'
+# A PostgREST filter on a timestamp, e.g. gte.2026-09-19T08:15:02.123456+00:00
+_TIMESTAMP_VALUE = re.compile(r'^((?:[a-z]+\.)*)\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}[\d:.]*(?:Z|[+ -]\d{2}:?\d{2})?$')
+_SECRET_PARAMS = {'key', 'api_key', 'apikey', 'access_token'}
+_SECRET_ENV_VARS = ('GOOGLE_PLACES_API_KEY', 'GEMINI_API_KEY', 'SUPABASE_KEY')
+
+
+def _secrets():
+    # Short values are placeholders (e.g. replay runs); replacing them would mangle bodies
+    return [value for value in (os.getenv(name) for name in _SECRET_ENV_VARS) if value and len(value) >= 8]
+
+
+def _query_value(name, value):
+    if name.lower() in _SECRET_PARAMS:
+        return REDACTED
+    return _TIMESTAMP_VALUE.sub(r'\g<1>' + VOLATILE, value)
+
+
+def redact_url(url):
+    """
+    Replaces secret query parameters and timestamp values and sorts the rest, so equal calls
+    get equal URLs.
+    """
+    parts = urlsplit(url)
+    query = sorted((k, _query_value(k, v)) for k, v in parse_qsl(parts.query, keep_blank_values=True))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def redact_body(body):
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    for secret in _secrets():
+        body = body.replace(secret.encode('utf-8'), REDACTED.encode('utf-8'))
+    return body
+
+
+def interaction_key(method, url, body):
+    body_hash = hashlib.sha1(redact_body(body)).hexdigest()[:16]
+    return f"{method.upper()} {redact_url(url)} {body_hash}"
+
+
+# --- Corpus ---
+
+class CorpusWriter:
+    """Appends interactions to the gzipped corpus; safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+
+    def write(self, method, url, body, status, content_type, content, latency_ms):
+        line = json.dumps({
+            'key': interaction_key(method, url, body),
+            'method': method.upper(),
+            'url': redact_url(url),
+            'status': status,
+            'content_type': content_type,
+            'body': redact_body(content).decode('utf-8', 'surrogateescape'),
+            'latency_ms': round(latency_ms, 1),
+        }, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Corpus:
+    """Recorded interactions indexed for replay. Repeated calls cycle through their recordings."""
+
+    def __init__(self, path):
+        self.by_key, self.by_url = {}, {}
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                self.by_key.setdefault(entry['key'], []).append(entry)
+                self.by_url.setdefault(f"{entry['method']} {entry['url']}", []).append(entry)
+        self._cycles = {}
+        self._lock = threading.Lock()
+        self.stats = {'exact': 0, 'url_only': 0, 'missing': 0}
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.by_key.values())
+
+    def _next(self, index, key):
+        with self._lock:
+            if key not in self._cycles:
+                self._cycles[key] = itertools.cycle(index[key])
+            return next(self._cycles[key])
+
+    def match(self, method, url, body):
+        key = interaction_key(method, url, body)
+        url_key = f"{method.upper()} {redact_url(url)}"
+        if key in self.by_key:
+            kind, entry = 'exact', self._next(self.by_key, key)
+        elif url_key in self.by_url:
+            kind, entry = 'url_only', self._next(self.by_url, url_key)
+        else:
+            kind, entry = 'missing', None
+        with self._lock:
+            self.stats[kind] += 1
+        return entry
+
+
+def _replay_delay(entry, timeout):
+    """Sleeps the recorded latency; returns False if the caller's timeout would have fired first."""
+    delay = entry['latency_ms'] / 1000 * REPLAY_LATENCY_SCALE
+    if isinstance(timeout, tuple):
+        timeout = timeout[-1]
+    if timeout is not None and delay > timeout:
+        time.sleep(timeout)
+        return False
+    time.sleep(delay)
+    return True
+
+
+# --- Transport Hooks ---
+
+_original_requests_send = requests.adapters.HTTPAdapter.send
+_original_httpx_handle = None
+_installed = None
+
+
+def _install_requests_hook(writer, corpus):
+    def send(adapter, request, **kwargs):
+        if corpus is not None:
+            entry = corpus.match(request.method, request.url, request.body)
+            if entry is None:
+                raise requests.exceptions.ConnectionError(f"No recorded response for {request.method} {redact_url(request.url)}", request=request)
+            if not _replay_delay(entry, kwargs.get('timeout')):
+                raise requests.exceptions.ReadTimeout(f"Replayed call to {redact_url(request.url)} timed out", request=request)
+            response = requests.models.Response()
+            response.status_code = entry['status']
+            response._content = entry['body'].encode('utf-8', 'surrogateescape')
+            response._content_consumed = True  # lets streamed reads (Gemini SSE) iterate the body
+            response.headers['Content-Type'] = entry['content_type'] or 'application/json'
+            response.encoding = 'utf-8'
+            response.url = request.url
+            response.request = request
+            return response
+
+        started = time.perf_counter()
+        response = _original_requests_send(adapter, request, **kwargs)
+        content = response.content  # read the (possibly streamed) body before taking the latency
+        latency_ms = (time.perf_counter() - started) * 1000
+        writer.write(request.method, request.url, request.body, response.status_code,
+                     response.headers.get('Content-Type'), content, latency_ms)
+        return response
+
+    requests.adapters.HTTPAdapter.send = send
+
+
+def _install_httpx_hook(writer, corpus):
+    global _original_httpx_handle
+    try:
+        import httpx
+    except ImportError:
+        return  # no Supabase client installed, so nothing to hook
+    _original_httpx_handle = httpx.HTTPTransport.handle_request
+
+    def handle_request(transport, request):
+        body = request.read()
+        if corpus is not None:
+            entry = corpus.match(request.method, str(request.url), body)
+            if entry is None:
+                raise httpx.ConnectError(f"No recorded response for {request.method} {redact_url(str(request.url))}", request=request)
+            _replay_delay(entry, None)
+            return httpx.Response(entry['status'], headers={'Content-Type': entry['content_type'] or 'application/json'},
+                                  content=entry['body'].encode('utf-8', 'surrogateescape'), request=request)
+
+        started = time.perf_counter()
+        response = _original_httpx_handle(transport, request)
+        content = response.read()
+        latency_ms = (time.perf_counter() - started) * 1000
+        writer.write(request.method, str(request.url), body, response.status_code,
+                     response.headers.get('Content-Type'), content, latency_ms)
+        return response
+
+    httpx.HTTPTransport.handle_request = handle_request
+
+
+def install_upstream_mode(mode=UPSTREAM_MODE, corpus_path=UPSTREAM_CORPUS):
+    """
+    Hooks the HTTP clients for record or replay mode. Returns the CorpusWriter (record) or
+    Corpus (replay), or None when the mode is 'off'. Installing twice is a no-op.
+    """
+    global _installed
+    if mode == 'off' or _installed is not None:
+        return _installed
+    if mode == 'record':
+        writer, corpus = CorpusWriter(corpus_path), None
+        print(f"UPSTREAM RECORD mode: appending upstream calls to '{corpus_path}'.")
+    elif mode == 'replay':
+        writer, corpus = None, Corpus(corpus_path)
+        print(f"UPSTREAM REPLAY mode: serving {len(corpus)} recorded calls from '{corpus_path}'.")
+    else:
+        raise ValueError(f"Unknown UPSTREAM_MODE '{mode}'; expected off, record or replay.")
+    _install_requests_hook(writer, corpus)
+    _install_httpx_hook(writer, corpus)
+    _installed = writer or corpus
+    return _installed
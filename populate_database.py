@@ -151,7 +151,7 @@ CITIES_TO_PREPOPULATE = [
     "Syracuse, New York",
     "Knoxville, Tennessee",
     "Augusta, Georgia",
-    "Columbia, South Carolina"
+    "Columbia, South Carolina",
     "Tokyo, Japan",
     "Delhi, India",
     "Mumbai, India",
@@ -397,29 +397,29 @@ def populate_data():
             continue # Go to the next city
 
 
-        # --- STEP 2: Fetch places for each filter using the coordinates ---
+        # --- STEP 2: Fetch places for all filters in one call using the coordinates ---
+        # The backend makes a single Places query and a single Gemini call for all filters,
+        # then caches each filter's list separately.
         if coords:
-            print(f"  Step 2: Fetching places for '{city}' using its coordinates...")
-            for filter_type in FILTERS:
-                # Construct the URL with the coordinates we just found
-                request_url = f"{BACKEND_BASE_URL}/get-restaurants?lat={coords['lat']}&lon={coords['lng']}&type={filter_type}&city={requests.utils.quote(city)}"
+            print(f"  Step 2: Fetching {', '.join(FILTERS)} for '{city}' using its coordinates...")
+            request_url = f"{BACKEND_BASE_URL}/get-restaurants?lat={coords['lat']}&lon={coords['lng']}&types={','.join(FILTERS)}&city={requests.utils.quote(city)}"
 
-                print(f"    Fetching {filter_type}...")
-                try:
-                    # Make the request with a long timeout, as the Gemini call can be slow
-                    response = requests.get(request_url, timeout=120)
+            try:
+                # Make the request with a long timeout, as the Gemini call can be slow
+                response = requests.get(request_url, timeout=120)
 
-                    if response.status_code == 200:
-                        print(f"      SUCCESS: Data for '{filter_type}' populated.")
-                    else:
-                        print(f"      ERROR: Failed to get data for '{filter_type}'. Status Code: {response.status_code}")
-                        print(f"        Response: {response.text}")
-                    
-                    # Wait for a moment between individual filter requests
-                    time.sleep(1)
+                if response.status_code == 200:
+                    for filter_type, result in response.json().get("results", {}).items():
+                        if "error" in result:
+                            print(f"      NO DATA for '{filter_type}': {result['error']}")
+                        else:
+                            print(f"      SUCCESS: Data for '{filter_type}' populated ({len(result['raw_data'])} places).")
+                else:
+                    print(f"      ERROR: Failed to get data. Status Code: {response.status_code}")
+                    print(f"        Response: {response.text}")
 
-                except requests.exceptions.RequestException as e:
-                    print(f"      CRITICAL ERROR: The request for places failed for '{filter_type}'. Error: {e}")
+            except requests.exceptions.RequestException as e:
+                print(f"      CRITICAL ERROR: The request for places failed for '{city}'. Error: {e}")
 
         # A longer pause between each city to be respectful of API rate limits
         print(f"--- Finished processing {city}. Waiting before next city... ---")